@@ -0,0 +1,63 @@
+"""add full-text and trigram search indexes to posts table
+
+Revision ID: 3c1e4a0b9d27
+Revises: 579c62f8a7b7
+Create Date: 2026-10-18 11:47:05.331872
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "3c1e4a0b9d27"
+down_revision: Union[str, None] = "579c62f8a7b7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.add_column(
+        "posts",
+        sa.Column(
+            "search_vector",
+            postgresql.TSVECTOR(),
+            sa.Computed(
+                "to_tsvector('english', title || ' ' || content)", persisted=True
+            ),
+        ),
+    )
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_posts_search_vector",
+            "posts",
+            ["search_vector"],
+            postgresql_using="gin",
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_posts_title_trgm",
+            "posts",
+            ["title"],
+            postgresql_using="gin",
+            postgresql_ops={"title": "gin_trgm_ops"},
+            postgresql_concurrently=True,
+        )
+    pass
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_posts_title_trgm", table_name="posts", postgresql_concurrently=True
+        )
+        op.drop_index(
+            "ix_posts_search_vector", table_name="posts", postgresql_concurrently=True
+        )
+    op.drop_column("posts", "search_vector")
+    pass
@@ -0,0 +1,39 @@
+"""add created_at/id index to posts table
+
+Revision ID: 579c62f8a7b7
+Revises: edd42efd2d92
+Create Date: 2026-10-18 11:03:27.918264
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "579c62f8a7b7"
+down_revision: Union[str, None] = "edd42efd2d92"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Build the index without blocking writes on a populated posts table
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_posts_created_at_id",
+            "posts",
+            ["created_at", "id"],
+            postgresql_concurrently=True,
+        )
+    pass
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_posts_created_at_id", table_name="posts", postgresql_concurrently=True
+        )
+    pass
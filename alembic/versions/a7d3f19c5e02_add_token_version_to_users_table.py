@@ -0,0 +1,30 @@
+"""add token_version to users table
+
+Revision ID: a7d3f19c5e02
+Revises: 3c1e4a0b9d27
+Create Date: 2026-10-18 14:06:52.418390
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a7d3f19c5e02"
+down_revision: Union[str, None] = "3c1e4a0b9d27"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "users",
+        sa.Column("token_version", sa.Integer(), nullable=False, server_default="0"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("users", "token_version")
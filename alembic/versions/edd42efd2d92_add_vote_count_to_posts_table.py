@@ -0,0 +1,84 @@
+"""add vote_count to posts table
+
+Revision ID: edd42efd2d92
+Revises: 84486db0c983
+Create Date: 2026-10-18 10:12:41.503117
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "edd42efd2d92"
+down_revision: Union[str, None] = "84486db0c983"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "posts",
+        sa.Column("vote_count", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.execute(
+        """
+        CREATE FUNCTION posts_vote_count_insert() RETURNS trigger AS $$
+        BEGIN
+            UPDATE posts SET vote_count = posts.vote_count + delta.n
+            FROM (SELECT post_id, count(*) AS n FROM new_votes GROUP BY post_id) AS delta
+            WHERE posts.id = delta.post_id;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE FUNCTION posts_vote_count_delete() RETURNS trigger AS $$
+        BEGIN
+            UPDATE posts SET vote_count = posts.vote_count - delta.n
+            FROM (SELECT post_id, count(*) AS n FROM old_votes GROUP BY post_id) AS delta
+            WHERE posts.id = delta.post_id;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    # Lock votes while the triggers are installed and the counters backfilled
+    # so no vote slips in between the two.
+    op.execute("LOCK TABLE votes IN SHARE ROW EXCLUSIVE MODE")
+    op.execute(
+        """
+        CREATE TRIGGER votes_count_insert AFTER INSERT ON votes
+        REFERENCING NEW TABLE AS new_votes
+        FOR EACH STATEMENT EXECUTE FUNCTION posts_vote_count_insert()
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER votes_count_delete AFTER DELETE ON votes
+        REFERENCING OLD TABLE AS old_votes
+        FOR EACH STATEMENT EXECUTE FUNCTION posts_vote_count_delete()
+        """
+    )
+    op.execute(
+        """
+        UPDATE posts SET vote_count = counts.n
+        FROM (SELECT post_id, count(*) AS n FROM votes GROUP BY post_id) AS counts
+        WHERE posts.id = counts.post_id
+        """
+    )
+    pass
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER votes_count_delete ON votes")
+    op.execute("DROP TRIGGER votes_count_insert ON votes")
+    op.execute("DROP FUNCTION posts_vote_count_delete()")
+    op.execute("DROP FUNCTION posts_vote_count_insert()")
+    op.drop_column("posts", "vote_count")
+    pass
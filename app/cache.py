@@ -0,0 +1,128 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+
+class TTLCache:
+    """Bounded in-process LRU cache whose entries expire after ``ttl`` seconds.
+
+    Entries may be given a shorter lifetime on ``set``. Safe to share between
+    the event loop and threadpool workers of one process; every worker process
+    keeps its own copy.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+class SingleFlight:
+    """Coalesces concurrent identical reads into one call.
+
+    The first caller for a key runs ``fn``; callers arriving while it is in
+    flight await its result instead of running their own, and for ``ttl``
+    seconds afterwards the result is served from a small cache. ``None``
+    results are shared with waiting callers but never cached. Coalescing is
+    per event loop, i.e. per worker.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.results = TTLCache(maxsize, ttl)
+        self.executed = 0
+        self.coalesced = 0
+        self.cached = 0
+        self._in_flight: dict = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        result = self.results.get(key)
+        if result is not None:
+            self.cached += 1
+            return result
+
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # the leading request went away, not this one: run it ourselves
+                return await self.do(key, fn)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        self.executed += 1
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as error:
+            future.set_exception(error)
+            future.exception()  # retrieved, even when nobody was waiting
+            raise
+        finally:
+            del self._in_flight[key]
+        future.set_result(result)
+        if result is not None:
+            self.results.set(key, result)
+        return result
+
+    def clear(self):
+        self.results.clear()
+        self.executed = 0
+        self.coalesced = 0
+        self.cached = 0
+
+    def stats(self) -> dict:
+        return {
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "cached": self.cached,
+        }
@@ -1,26 +1,349 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from fastapi import Depends, Request, Response
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+import hashlib
+import hmac
+import itertools
+import math
 import psycopg2
 from psycopg2.extras import RealDictCursor
 import time
+from .cache import TTLCache
 from .config import settings
+from .metrics import PoolMetrics, after_cursor_execute, before_cursor_execute
 
 
 SQLALCHEMY_DATABASE_URL = f"postgresql://{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_name}"
+SQLALCHEMY_ASYNC_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace(
+    "postgresql://", "postgresql+asyncpg://", 1
+)
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+class _InstrumentedPoolMixin:
+    """Records checkout wait times, overflow connections and checkout
+    timeouts of a queue pool in ``self.metrics``."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        overflow = self._overflow
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        finally:
+            self.metrics.checkout_wait.observe(time.perf_counter() - start)
+        if self._overflow > max(overflow, 0):
+            self.metrics.overflow_events += 1
+        return connection
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncAdaptedQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+POOL_OPTIONS = dict(
+    pool_size=settings.database_pool_size,
+    max_overflow=settings.database_max_overflow,
+    pool_timeout=settings.database_pool_timeout,
+    pool_recycle=settings.database_pool_recycle,
+    pool_pre_ping=settings.database_pool_pre_ping,
+)
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL, poolclass=InstrumentedQueuePool, **POOL_OPTIONS
+)
+SessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, expire_on_commit=False, bind=engine
+)
+
+async_engine = create_async_engine(
+    SQLALCHEMY_ASYNC_DATABASE_URL,
+    poolclass=InstrumentedAsyncAdaptedQueuePool,
+    **POOL_OPTIONS,
+)
+AsyncSessionLocal = async_sessionmaker(
+    autoflush=False, expire_on_commit=False, bind=async_engine
+)
 
 Base = declarative_base()
 
+# Attribute every SQL statement, and the time it took, to the request being
+# served. Listening on Engine covers the async engine and the test engines too.
+event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+
+
+class _StreamedResultAdapter:
+    """Awaitable ``partitions`` over a server-side cursor ``Result``, fetching
+    each partition on the threadpool."""
+
+    def __init__(self, result):
+        self.result = result
+
+    async def partitions(self, size=None):
+        partitions = self.result.partitions(size)
+        while (rows := await run_in_threadpool(next, partitions, None)) is not None:
+            yield rows
+
+    async def close(self):
+        await run_in_threadpool(self.result.close)
+
+
+class SyncSessionAdapter:
+    """Exposes a blocking ``Session`` through the awaitable subset of the
+    ``AsyncSession`` API used by the routers.
+
+    Every call that may touch the database runs on the threadpool, so the
+    routers are written once against the async API and the sync driver can
+    still be selected with ``DATABASE_ASYNC=false`` for A/B comparisons.
+    """
+
+    def __init__(self, session):
+        self.sync_session = session
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    async def execute(self, statement, params=None, **kwargs):
+        return await run_in_threadpool(
+            self.sync_session.execute, statement, params, **kwargs
+        )
+
+    async def scalar(self, statement, params=None, **kwargs):
+        return await run_in_threadpool(
+            self.sync_session.scalar, statement, params, **kwargs
+        )
+
+    async def scalars(self, statement, params=None, **kwargs):
+        return await run_in_threadpool(
+            self.sync_session.scalars, statement, params, **kwargs
+        )
+
+    async def stream(self, statement, params=None, **kwargs):
+        result = await run_in_threadpool(
+            self.sync_session.execute,
+            statement.execution_options(stream_results=True),
+            params,
+            **kwargs,
+        )
+        return _StreamedResultAdapter(result)
+
+    async def get(self, entity, ident, **kwargs):
+        return await run_in_threadpool(self.sync_session.get, entity, ident, **kwargs)
+
+    async def refresh(self, instance, attribute_names=None):
+        await run_in_threadpool(self.sync_session.refresh, instance, attribute_names)
+
+    async def delete(self, instance):
+        await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def flush(self):
+        await run_in_threadpool(self.sync_session.flush)
+
+    async def commit(self):
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self):
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def close(self):
+        await run_in_threadpool(self.sync_session.close)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+    async def connection(self):
+        return await run_in_threadpool(self.sync_session.connection)
+
+    @property
+    def info(self) -> dict:
+        return self.sync_session.info
+
+
+def pool_status(engine) -> dict:
+    pool = engine.pool
+    status = {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+    }
+    if isinstance(pool, _InstrumentedPoolMixin):
+        status.update(pool.metrics.snapshot())
+    return status
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.url = url
+        self.engine = create_engine(
+            url, poolclass=InstrumentedQueuePool, **POOL_OPTIONS
+        )
+        self.async_engine = create_async_engine(
+            url.replace("postgresql://", "postgresql+asyncpg://", 1),
+            poolclass=InstrumentedAsyncAdaptedQueuePool,
+            **POOL_OPTIONS,
+        )
+        self.down_until = 0.0
+
+    def session(self):
+        if settings.database_async:
+            return AsyncSession(
+                bind=self.async_engine, autoflush=False, expire_on_commit=False
+            )
+        return SyncSessionAdapter(
+            sessionmaker(autoflush=False, expire_on_commit=False, bind=self.engine)()
+        )
+
+
+# Set on responses to writes, it keeps the client on the primary in every
+# worker until the (signed) deadline it carries
+STICKY_COOKIE = "read_primary_until"
+
+
+def _sign(value: str) -> str:
+    return hmac.new(
+        settings.secret_key.encode(), value.encode(), hashlib.sha256
+    ).hexdigest()
+
+
+class ReplicaSet:
+    """Round-robin over the read replicas of this worker.
+
+    A replica that fails to hand out a connection is skipped for
+    ``retry_seconds``. Users who wrote within the last ``sticky_seconds`` read
+    from the primary so they always see their own writes despite replica lag:
+    the writer's client gets a signed ``STICKY_COOKIE`` honoured by every
+    worker, and this worker also remembers the user id for clients that drop
+    cookies.
+    """
+
+    def __init__(self, urls, retry_seconds: float, sticky_seconds: float):
+        self.replicas = [Replica(url) for url in urls]
+        self.retry_seconds = retry_seconds
+        self.sticky_seconds = sticky_seconds
+        self.last_write = float("-inf")
+        self._next = itertools.count()
+        self._recent_writers = TTLCache(
+            settings.read_your_writes_cache_size, sticky_seconds
+        )
+
+    def mark_write(self, response: Response, user_id: int):
+        """Call after a write by ``user_id`` has been committed."""
+        if not self.replicas:
+            return
+        self.last_write = time.monotonic()
+        self._recent_writers.set(user_id, True)
+        until = str(math.ceil(time.time() + self.sticky_seconds))
+        response.set_cookie(
+            STICKY_COOKIE,
+            f"{until}.{_sign(until)}",
+            max_age=math.ceil(self.sticky_seconds),
+            httponly=True,
+            samesite="lax",
+        )
+
+    def may_lag(self) -> bool:
+        """Whether replicas may not have caught up with a write committed by
+        this worker yet, i.e. with the versions behind its current ETags."""
+        return time.monotonic() - self.last_write < self.sticky_seconds
+
+    def mark_down(self, replica: Replica):
+        replica.down_until = time.monotonic() + self.retry_seconds
+
+    def candidates(self, user_id=None, sticky_cookie=None) -> list[Replica]:
+        if not self.replicas:
+            return []
+        if user_id is not None and self._recent_writers.get(user_id):
+            return []
+        if sticky_cookie:
+            until, _, signature = sticky_cookie.partition(".")
+            if (
+                until.isdigit()
+                and hmac.compare_digest(signature, _sign(until))
+                and int(until) > time.time()
+            ):
+                return []
+        start = next(self._next) % len(self.replicas)
+        ordered = self.replicas[start:] + self.replicas[:start]
+        now = time.monotonic()
+        return [replica for replica in ordered if replica.down_until <= now]
+
+
+replicas = ReplicaSet(
+    settings.database_replica_urls,
+    retry_seconds=settings.database_replica_retry_seconds,
+    sticky_seconds=settings.read_your_writes_seconds,
+)
+
 
 # Dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+async def get_db():
+    if settings.database_async:
+        async with AsyncSessionLocal() as db:
+            yield db
+    else:
+        db = SyncSessionAdapter(SessionLocal())
+        try:
+            yield db
+        finally:
+            await db.close()
+
+
+def get_db_factory(request: Request):
+    """Opens sessions that outlive the request's dependencies.
+
+    Dependencies with yield are torn down before a ``StreamingResponse`` body
+    is sent, so streaming endpoints open their session inside the body
+    iterator through this factory, which honours overrides of ``get_db``.
+    """
+    return asynccontextmanager(request.app.dependency_overrides.get(get_db, get_db))
+
+
+async def get_read_db(request: Request, primary=Depends(get_db)):
+    """Session for safe reads, served by a healthy replica when configured.
+
+    The connection is checked out up front (pre-pinged) so a dead replica is
+    detected here and the read falls over to the next one, then the primary.
+    """
+    user_id = getattr(request.state, "user_id", None)
+    sticky_cookie = request.cookies.get(STICKY_COOKIE)
+    for replica in replicas.candidates(user_id, sticky_cookie):
+        db = replica.session()
+        db.info["replica"] = True
+        try:
+            await db.connection()
+        except (exc.DBAPIError, OSError):  # asyncpg raises OSError on connect
+            replicas.mark_down(replica)
+            await db.close()
+            continue
+        try:
+            yield db
+        finally:
+            await db.close()
+        return
+    yield primary
+
+
+def served_by_replica(db) -> bool:
+    return db.info.get("replica", False)
 
 
 # Keeping below code for reference in case I want to use & run raw SQL using "psycopg2" postgres library directly without using SQLAlchemy
@@ -0,0 +1,286 @@
+"""Bulk loading of posts and votes with ``COPY ... FROM STDIN``.
+
+Records arrive as NDJSON or CSV (with a header row), are validated with
+``schemas.PostCreate`` / ``schemas.Vote`` and copied in chunks, each chunk in
+its own transaction. Rows that fail validation are reported per chunk with
+their line number instead of failing the import. Also usable from the shell:
+
+    python -m app.ingest posts posts.ndjson --user-id 1
+    python -m app.ingest votes votes.csv --format csv --user-id 1
+"""
+
+import argparse
+import asyncio
+import csv
+import io
+import json
+import sys
+import time
+from typing import Callable, Literal, Optional
+
+import asyncpg
+import orjson
+import psycopg2
+from pydantic import ValidationError
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from . import models, schemas
+from .config import settings
+from .database import AsyncSessionLocal, SyncSessionAdapter
+
+Table = Literal["posts", "votes"]
+Format = Literal["ndjson", "csv"]
+
+POST_COLUMNS = ("title", "content", "published", "owner_id")
+VOTE_COLUMNS = ("post_id", "user_id")
+
+# Votes land in a staging table first so duplicates and votes on missing posts
+# are skipped by one INSERT ... SELECT instead of aborting the whole COPY
+CREATE_VOTES_STAGING = text(
+    "CREATE TEMP TABLE IF NOT EXISTS votes_staging "
+    "(post_id integer NOT NULL, user_id integer NOT NULL) ON COMMIT DELETE ROWS"
+)
+INSERT_STAGED_VOTES = text(
+    "INSERT INTO votes (post_id, user_id) "
+    "SELECT DISTINCT s.post_id, s.user_id FROM votes_staging s "
+    "JOIN posts ON posts.id = s.post_id "
+    "ON CONFLICT DO NOTHING"
+)
+
+
+async def _lines(stream):
+    """Split an async iterable of byte blocks into numbered lines."""
+    pending = b""
+    number = 0
+    async for block in stream:
+        pending += block
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            number += 1
+            yield number, line
+    if pending:
+        yield number + 1, pending
+
+
+async def read_records(stream, format: Format = "ndjson"):
+    """Yield ``(line number, record)`` pairs, where a record that cannot be
+    parsed is the exception raised while parsing it."""
+    header = None
+    record_lines = []
+    async for number, line in _lines(stream):
+        if format == "csv":
+            record_lines.append(line)
+            # an odd number of quotes leaves a quoted field (and newline) open
+            if b"".join(record_lines).count(b'"') % 2:
+                continue
+            line, record_lines = b"\n".join(record_lines), []
+        if not line.strip():
+            continue
+        try:
+            if format == "ndjson":
+                record = orjson.loads(line)
+            else:
+                values = next(csv.reader([line.decode().rstrip("\r")]))
+                if header is None:
+                    header = values
+                    continue
+                # empty cells fall back to the schema defaults
+                record = {key: value for key, value in zip(header, values) if value}
+        except (ValueError, csv.Error) as error:
+            record = error
+        yield number, record
+    if record_lines:
+        yield number, csv.Error("unterminated quoted field")
+
+
+def _error_message(error: Exception) -> str:
+    if isinstance(error, ValidationError):
+        return "; ".join(
+            f"{'.'.join(map(str, detail['loc'])) or 'record'}: {detail['msg']}"
+            for detail in error.errors(include_url=False)
+        )
+    return str(error)
+
+
+def validate_posts(records, user_id: int):
+    rows, rejects = [], []
+    for number, record in records:
+        try:
+            if isinstance(record, Exception):
+                raise record
+            post = schemas.PostCreate.model_validate(record)
+        except (ValueError, csv.Error) as error:
+            rejects.append({"line": number, "error": _error_message(error)})
+            continue
+        rows.append((post.title, post.content, post.published, user_id))
+    return rows, rejects
+
+
+def validate_votes(records, user_id: int):
+    rows, rejects = [], []
+    for number, record in records:
+        try:
+            if isinstance(record, Exception):
+                raise record
+            vote = schemas.Vote.model_validate(record)
+            if vote.dir != 1:
+                raise ValueError("only votes with dir=1 can be imported")
+        except (ValueError, csv.Error) as error:
+            rejects.append({"line": number, "error": _error_message(error)})
+            continue
+        rows.append((vote.post_id, user_id))
+    return rows, rejects
+
+
+def _copy_text(value) -> str:
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _copy_sync(session, table: str, columns, rows):
+    buffer = io.StringIO(
+        "".join("\t".join(map(_copy_text, row)) + "\n" for row in rows)
+    )
+    cursor = session.connection().connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+    finally:
+        cursor.close()
+
+
+async def copy_rows(db, table: str, columns, rows):
+    """COPY ``rows`` into ``table`` inside the session's transaction."""
+    if isinstance(db, SyncSessionAdapter):
+        await db.run_sync(_copy_sync, table, columns, rows)
+        return
+    connection = await (await db.connection()).get_raw_connection()
+    # binary COPY straight from Python tuples
+    await connection.driver_connection.copy_records_to_table(
+        table, records=rows, columns=columns
+    )
+
+
+async def copy_posts(db, rows) -> int:
+    await copy_rows(db, models.Post.__tablename__, POST_COLUMNS, rows)
+    return len(rows)
+
+
+async def copy_votes(db, rows) -> int:
+    await db.execute(CREATE_VOTES_STAGING)
+    await copy_rows(db, "votes_staging", VOTE_COLUMNS, rows)
+    result = await db.execute(INSERT_STAGED_VOTES)
+    return result.rowcount
+
+
+# COPY goes through the raw driver connection, so its failures surface as
+# asyncpg / psycopg2 errors rather than wrapped in SQLAlchemy's DBAPIError
+COPY_ERRORS = (DBAPIError, asyncpg.PostgresError, psycopg2.Error)
+
+VALIDATORS = {"posts": validate_posts, "votes": validate_votes}
+LOADERS = {"posts": copy_posts, "votes": copy_votes}
+
+
+async def ingest(
+    db,
+    table: Table,
+    stream,
+    user_id: int,
+    format: Format = "ndjson",
+    chunk_size: Optional[int] = None,
+    after_commit: Optional[Callable[[list], None]] = None,
+) -> dict:
+    """Load records from ``stream`` (an async iterable of bytes) into
+    ``table`` on behalf of ``user_id``, who owns the posts or casts the votes.
+
+    Returns totals and a report per chunk. ``skipped`` counts valid rows the
+    database ignored: votes already cast or on posts that do not exist, or the
+    whole chunk when its COPY failed (see the chunk's ``error``).
+    """
+    chunk_size = chunk_size or settings.ingest_chunk_size
+    validate, load = VALIDATORS[table], LOADERS[table]
+    report = {"table": table, "inserted": 0, "skipped": 0, "rejected": 0, "chunks": []}
+
+    async def flush(records):
+        rows, rejects = validate(records, user_id)
+        chunk = {
+            "chunk": len(report["chunks"]),
+            "lines": [records[0][0], records[-1][0]],
+            "inserted": 0,
+            "skipped": 0,
+            "rejected": rejects,
+        }
+        if rows:
+            try:
+                chunk["inserted"] = await load(db, rows)
+                await db.commit()
+            except COPY_ERRORS as error:
+                await db.rollback()
+                chunk["error"] = str(getattr(error, "orig", error))
+            else:
+                if after_commit is not None:
+                    after_commit(rows)
+            chunk["skipped"] = len(rows) - chunk["inserted"]
+        report["inserted"] += chunk["inserted"]
+        report["skipped"] += chunk["skipped"]
+        report["rejected"] += len(rejects)
+        report["chunks"].append(chunk)
+
+    records = []
+    async for record in read_records(stream, format):
+        records.append(record)
+        if len(records) == chunk_size:
+            await flush(records)
+            records = []
+    if records:
+        await flush(records)
+    return report
+
+
+async def _read_file(file, block_size=1 << 20):
+    while block := await asyncio.to_thread(file.read, block_size):
+        yield block
+
+
+async def main(args):
+    file = sys.stdin.buffer if args.path == "-" else open(args.path, "rb")
+    try:
+        async with AsyncSessionLocal() as db:
+            if await db.get(models.User, args.user_id) is None:
+                sys.exit(f"User {args.user_id} does not exist")
+            start = time.perf_counter()
+            report = await ingest(
+                db,
+                args.table,
+                _read_file(file),
+                user_id=args.user_id,
+                format=args.format,
+                chunk_size=args.chunk_size,
+            )
+            elapsed = time.perf_counter() - start
+    finally:
+        file.close()
+    report["rows_per_second"] = report["inserted"] / elapsed if elapsed else None
+    if not args.verbose:
+        report["chunks"] = [chunk for chunk in report["chunks"] if chunk["rejected"]]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("table", choices=["posts", "votes"])
+    parser.add_argument("path", help="file to load, - for stdin")
+    parser.add_argument("--user-id", type=int, required=True)
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    parser.add_argument("--chunk-size", type=int, default=None)
+    parser.add_argument(
+        "--verbose", action="store_true", help="report every chunk, not only rejects"
+    )
+    asyncio.run(main(parser.parse_args()))
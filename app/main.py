@@ -1,13 +1,25 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from .database import engine
-from .routers import post, user, auth, vote
+from .routers import post, user, auth, vote, ingest, internal, metrics
+from . import utils
+from .config import settings
+from .middleware import CompressionMiddleware, MetricsMiddleware
+from .responses import FastJSONResponse
 
 from fastapi.middleware.cors import CORSMiddleware
 
 # We do not require below sqlalchemy engine to create tables in database as we have alembic now to do the same.
 #  models.Base.metadata.create_all(bind=engine)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    utils.shutdown_hash_executor()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 
 origins = ["*"]
 
@@ -17,13 +29,29 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "ETag",
+        "X-Next-Cursor",
+        "X-Total-Count",
+        "X-Total-Count-Estimated",
+    ],
+)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.compression_minimum_size,
+    level=settings.compression_level,
+    exclude_paths=settings.compression_exclude_paths,
 )
+app.add_middleware(MetricsMiddleware)
 
 
 app.include_router(post.router)
 app.include_router(user.router)
 app.include_router(auth.router)
 app.include_router(vote.router)
+app.include_router(ingest.router)
+app.include_router(internal.router)
+app.include_router(metrics.router)
 
 
 @app.get("/")
@@ -0,0 +1,153 @@
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+# Seconds, spanning sub-millisecond pool checkouts to multi-second requests
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+
+
+class Histogram:
+    """Fixed-bucket histogram of observations, in seconds."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # one extra slot for observations above the last bucket (+Inf)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+        cumulative, buckets = 0, {}
+        for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+            cumulative += bucket_count
+            buckets[str(bound)] = cumulative
+        return {"buckets": buckets, "sum": total, "count": count}
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.checkout_wait = Histogram()
+        self.overflow_events = 0
+        self.timeouts = 0
+
+    def snapshot(self) -> dict:
+        return {
+            "checkout_wait_seconds": self.checkout_wait.snapshot(),
+            "overflow_events": self.overflow_events,
+            "checkout_timeouts": self.timeouts,
+        }
+
+
+class RequestStats:
+    """SQL work attributed to the request being served."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar(
+    "current_request", default=None
+)
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.latency = Histogram()
+        self.db_latency = Histogram()
+        self.statuses: dict[int, int] = {}
+        self.queries = 0
+
+
+class HTTPMetrics:
+    """Per route request metrics of this worker, keyed by (method, route template)."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.routes: dict[tuple[str, str], RouteMetrics] = {}
+        self._lock = threading.Lock()
+
+    def record(self, method: str, route: str, status: int, seconds: float, stats):
+        key = (method, route)
+        with self._lock:
+            metrics = self.routes.get(key)
+            if metrics is None:
+                metrics = self.routes[key] = RouteMetrics()
+            metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+            metrics.queries += stats.queries
+        metrics.latency.observe(seconds)
+        metrics.db_latency.observe(stats.db_seconds)
+
+
+http_metrics = HTTPMetrics()
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    stats = current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+    return "{" + pairs + "}"
+
+
+class PrometheusWriter:
+    """Builds the Prometheus text exposition format. Samples may be added in any
+    order, they are grouped by metric family on render."""
+
+    def __init__(self):
+        self._families: dict[str, tuple[str, str, list[str]]] = {}
+
+    def _lines(self, name: str, kind: str, help: str) -> list[str]:
+        if name not in self._families:
+            self._families[name] = (kind, help, [])
+        return self._families[name][2]
+
+    def sample(self, name: str, kind: str, help: str, value, labels=None):
+        self._lines(name, kind, help).append(f"{name}{_labels(labels or {})} {value}")
+
+    def histogram(self, name: str, help: str, histogram: Histogram, labels=None):
+        lines = self._lines(name, "histogram", help)
+        labels = labels or {}
+        snapshot = histogram.snapshot()
+        for bound, count in snapshot["buckets"].items():
+            lines.append(f"{name}_bucket{_labels({**labels, 'le': bound})} {count}")
+        lines.append(f"{name}_sum{_labels(labels)} {snapshot['sum']}")
+        lines.append(f"{name}_count{_labels(labels)} {snapshot['count']}")
+
+    def render(self) -> str:
+        output = []
+        for name, (kind, help, lines) in self._families.items():
+            output.append(f"# HELP {name} {help}")
+            output.append(f"# TYPE {name} {kind}")
+            output.extend(lines)
+        return "\n".join(output) + "\n"
@@ -0,0 +1,151 @@
+import time
+import zlib
+from starlette.datastructures import Headers, MutableHeaders
+from .metrics import RequestStats, current_request, http_metrics
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/x-ndjson")
+
+
+class MetricsMiddleware:
+    """Times every HTTP request and attributes the SQL it ran to its route.
+
+    Pure ASGI rather than BaseHTTPMiddleware, so streamed bodies are not
+    buffered and the request context (read by the SQL hooks) covers the
+    whole response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_metrics.in_flight += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_metrics.in_flight -= 1
+            current_request.reset(token)
+            # route templates keep label cardinality bounded, unlike raw paths
+            route = scope.get("route")
+            http_metrics.record(
+                scope["method"],
+                route.path if route is not None else "<unmatched>",
+                status_code,
+                time.perf_counter() - start,
+                stats,
+            )
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """Whether an Accept-Encoding header allows gzip, honouring q-values."""
+    weights = {}
+    for item in accept_encoding.split(","):
+        coding, *params = item.split(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding] = weight
+    return weights.get("gzip", weights.get("x-gzip", weights.get("*", 0))) > 0
+
+
+class CompressionMiddleware:
+    """Gzips JSON and text responses for clients that accept it.
+
+    Bodies smaller than ``minimum_size`` and paths starting with one of
+    ``exclude_paths`` are sent as is. Streamed bodies are compressed chunk by
+    chunk and flushed, so clients still receive them progressively. Strong
+    ETags are weakened since the compressed bytes differ from the identity
+    representation; If-None-Match uses weak comparison, so revalidation keeps
+    working.
+    """
+
+    def __init__(self, app, minimum_size=1024, level=6, exclude_paths=()):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.level = level
+        self.exclude_paths = tuple(exclude_paths)
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or self.level <= 0
+            or (self.exclude_paths and scope["path"].startswith(self.exclude_paths))
+            or not accepts_gzip(Headers(scope=scope).get("accept-encoding", ""))
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor
+            if message["type"] == "http.response.start":
+                # held back until the first body chunk shows whether to compress
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start_message is not None:
+                initial, start_message = start_message, None
+                headers = MutableHeaders(raw=initial["headers"])
+                if (
+                    "content-encoding" in headers
+                    or not headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+                    or (not more_body and len(body) < self.minimum_size)
+                ):
+                    await send(initial)
+                    await send(message)
+                    return
+                compressor = zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+                headers["Content-Encoding"] = "gzip"
+                headers.add_vary_header("Accept-Encoding")
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["ETag"] = f"W/{etag}"
+                body = compressor.compress(body) + compressor.flush(
+                    zlib.Z_SYNC_FLUSH if more_body else zlib.Z_FINISH
+                )
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    headers["Content-Length"] = str(len(body))
+                await send(initial)
+                await send({"type": "http.response.body", "body": body, "more_body": more_body})
+                return
+
+            if compressor is None:
+                await send(message)
+                return
+            body = compressor.compress(body) + compressor.flush(
+                zlib.Z_SYNC_FLUSH if more_body else zlib.Z_FINISH
+            )
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -1,9 +1,15 @@
 from jose import JWTError, jwt
+import hmac
+import time
 from datetime import datetime, timedelta, timezone
 from . import schemas, models
+from .cache import TTLCache
+from . import database
 from .database import get_db
-from sqlalchemy.orm import Session
-from fastapi import Depends, Response, HTTPException, status
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from fastapi import Depends, Header, Request, Response, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from .config import settings
 
@@ -14,36 +20,82 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 SECRET_KEY = settings.secret_key
 ALGORITHM = settings.algorithm
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
+REFRESH_TOKEN_EXPIRE_DAYS = settings.refresh_token_expire_days
+
+# Per worker caches sparing get_current_user the JWT decode (token -> claims)
+# and the users lookup (user id -> (schemas.UserOut, token version)) on every
+# request. A user update only evicts the entry in the worker that made it, so
+# the others see a bumped token version up to auth_cache_ttl_seconds late
+token_cache = TTLCache(settings.auth_cache_size, settings.auth_cache_ttl_seconds)
+user_cache = TTLCache(settings.auth_cache_size, settings.auth_cache_ttl_seconds)
 
 
 def create_access_token(data: dict):
     to_encode = data.copy()
 
     expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "type": "access"})
 
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
     return encoded_jwt
 
 
-def verify_access_token(token: str, credential_exception):
+def create_refresh_token(data: dict):
+    to_encode = data.copy()
+
+    expire = datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    to_encode.update({"exp": expire, "type": "refresh"})
+
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def create_tokens(user: models.User) -> dict:
+    """Access token carrying the claims get_current_user needs, and a refresh
+    token that stays valid until the user's token version is bumped."""
+    claims = {"user_id": user.id, "ver": user.token_version}
+    return {
+        "access_token": create_access_token({**claims, "email": user.email}),
+        "refresh_token": create_refresh_token(claims),
+        "token_type": "bearer",
+    }
+
+
+def _verify_token(token: str, token_type: str, credential_exception):
     try:
         # print(token)
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        id: str = str(payload.get("user_id"))
+        id = payload.get("user_id")
 
         if id is None:
             raise credential_exception
-        token_data = schemas.TokenData(id=id)
+        # tokens issued before token types existed are access tokens
+        if payload.get("type", "access") != token_type:
+            raise credential_exception
+        token_data = schemas.TokenData(
+            id=str(id),
+            exp=payload.get("exp"),
+            email=payload.get("email"),
+            ver=payload.get("ver"),
+        )
     except JWTError:
         raise credential_exception
 
     return token_data
 
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
+def verify_access_token(token: str, credential_exception):
+    return _verify_token(token, "access", credential_exception)
+
+
+def verify_refresh_token(token: str, credential_exception):
+    return _verify_token(token, "refresh", credential_exception)
+
+
+async def get_current_user(
+    request: Request,
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db),
 ):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -51,6 +103,62 @@ def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    token = verify_access_token(token=token, credential_exception=credentials_exception)
-    user = db.query(models.User).filter(models.User.id == token.id).first()
+    token_data = token_cache.get(token)
+    if token_data is None:
+        token_data = verify_access_token(
+            token=token, credential_exception=credentials_exception
+        )
+        if token_data.exp is not None:
+            # never serve a token from the cache past its expiry
+            token_cache.set(
+                token, token_data, ttl=token_data.exp.timestamp() - time.time()
+            )
+    user_id = int(token_data.id)
+    # lets database.get_read_db keep recent writers on the primary
+    request.state.user_id = user_id
+
+    if settings.auth_claims_only and token_data.email is not None:
+        return schemas.Principal.model_construct(id=user_id, email=token_data.email)
+
+    cached = user_cache.get(user_id)
+    if cached is None:
+        db_user = await db.get(models.User, user_id)
+        if db_user is None:
+            raise credentials_exception
+        cached = (schemas.UserOut.model_validate(db_user), db_user.token_version)
+        user_cache.set(user_id, cached)
+    user, token_version = cached
+    if token_data.ver is not None and token_data.ver != token_version:
+        raise credentials_exception
     return user
+
+
+async def get_read_db(
+    current_user: schemas.Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(database.get_read_db),
+):
+    """Replica session for an authenticated read; resolving the user first
+    makes read-your-writes stickiness apply to them."""
+    return db
+
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def invalidate_cached_user(mapper, connection, target):
+    user_cache.pop(target.id)
+
+
+def verify_internal_token(authorization: Optional[str] = Header(None)):
+    """Guards /metrics and /internal/* with ``Authorization: Bearer
+    <settings.internal_token>`` once a token is configured."""
+    if not settings.internal_token:
+        return
+    expected = f"Bearer {settings.internal_token}"
+    if authorization is None or not hmac.compare_digest(
+        authorization.encode(), expected.encode()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid internal token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
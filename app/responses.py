@@ -0,0 +1,74 @@
+import orjson
+from fastapi.responses import ORJSONResponse
+from . import schemas
+
+# Attributes copied off the ORM rows, read once from the response schemas so the
+# fast path cannot drift from what response_model documents
+POST_FIELDS = tuple(name for name in schemas.Post.model_fields if name != "owner")
+USER_FIELDS = tuple(schemas.UserOut.model_fields)
+
+
+class FastJSONResponse(ORJSONResponse):
+    """orjson rendering that formats UTC datetimes the way pydantic does."""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z)
+
+
+def user_to_dict(user) -> dict:
+    return {name: getattr(user, name) for name in USER_FIELDS}
+
+
+def post_to_dict(post, fields=None) -> dict:
+    """``fields`` restricts the output to a sparse fieldset of schemas.Post."""
+    data = {
+        name: getattr(post, name)
+        for name in POST_FIELDS
+        if fields is None or name in fields
+    }
+    if fields is None or "owner" in fields:
+        data["owner"] = user_to_dict(post.owner)
+    return data
+
+
+def post_out_to_dict(post, votes: int, fields=None) -> dict:
+    return {"Post": post_to_dict(post, fields), "votes": votes}
+
+
+def post_list_response(rows, headers=None, fields=None) -> FastJSONResponse:
+    """Serialize ``(Post, votes)`` rows straight to JSON bytes.
+
+    Rows come from the database and were validated on the way in, so the
+    per-row pydantic validation FastAPI would run against ``response_model``
+    is skipped.
+    """
+    return FastJSONResponse(
+        [post_out_to_dict(row.Post, row.votes, fields) for row in rows],
+        headers=headers,
+    )
+
+
+def post_batch_response(ids, rows, fields=None) -> FastJSONResponse:
+    """Serialize ``(Post, votes)`` rows as one entry per requested id, in
+    request order, with ``post`` set to null for ids that were not found."""
+    found = {
+        row.Post.id: post_out_to_dict(row.Post, row.votes, fields) for row in rows
+    }
+    return FastJSONResponse([{"id": id, "post": found.get(id)} for id in ids])
+
+
+def post_export_lines(rows) -> bytes:
+    """Serialize flat ``(*POST_FIELDS, *USER_FIELDS, votes)`` rows as NDJSON,
+    one ``PostOut`` shaped object per line."""
+    post_end = len(POST_FIELDS)
+    lines = []
+    for row in rows:
+        post = dict(zip(POST_FIELDS, row[:post_end]))
+        post["owner"] = dict(zip(USER_FIELDS, row[post_end:-1]))
+        lines.append(
+            orjson.dumps(
+                {"Post": post, "votes": row[-1]},
+                option=orjson.OPT_UTC_Z | orjson.OPT_APPEND_NEWLINE,
+            )
+        )
+    return b"".join(lines)
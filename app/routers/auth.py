@@ -1,6 +1,7 @@
-from fastapi import status, HTTPException, Depends, APIRouter
+from fastapi import status, HTTPException, Depends, APIRouter, Response
 from fastapi.security.oauth2 import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..database import get_db
 from .. import models, utils, oauth2, schemas
 
@@ -8,21 +9,19 @@ router = APIRouter(tags=["Authentication"])
 
 
 @router.post("/login", response_model=schemas.Token)
-def login(
+async def login(
     user_credential: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    user = (
-        db.query(models.User)
-        .filter(models.User.email == user_credential.username)
-        .first()
+    user = await db.scalar(
+        select(models.User).filter(models.User.email == user_credential.username)
     )
     if not user:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Invalid Credentials",
         )
-    if not utils.verify(user_credential.password, user.password):
+    if not await utils.verify_async(user_credential.password, user.password):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail=f"Invalid Credentials",
@@ -30,5 +29,42 @@ def login(
 
     # Create a token
     # Return a token
-    access_token = oauth2.create_access_token(data={"user_id": user.id})
-    return {"access_token": access_token, "token_type": "bearer"}
+    return oauth2.create_tokens(user)
+
+
+@router.post("/refresh", response_model=schemas.Token)
+async def refresh(body: schemas.RefreshRequest, db: AsyncSession = Depends(get_db)):
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    token_data = oauth2.verify_refresh_token(body.refresh_token, credentials_exception)
+    user = await db.get(models.User, int(token_data.id))
+    # a bumped token version (see /logout) revokes every earlier refresh token
+    if user is None or token_data.ver != user.token_version:
+        raise credentials_exception
+    return oauth2.create_tokens(user)
+
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(
+    db: AsyncSession = Depends(get_db),
+    current_user: int = Depends(oauth2.get_current_user),
+):
+    """Revoke every token of the current user.
+
+    Refresh tokens stop working at once. Access tokens are rejected at once by
+    this worker, and by the others once their cached token version expires,
+    i.e. within ``AUTH_CACHE_TTL_SECONDS``. In claims-only mode access tokens
+    that were already issued stay valid until they expire.
+    """
+    user = await db.get(models.User, current_user.id)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+        )
+    user.token_version = models.User.token_version + 1
+    await db.commit()
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
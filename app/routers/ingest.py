@@ -0,0 +1,43 @@
+from typing import Literal
+from fastapi import APIRouter, Depends, Header, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_db, replicas
+from .. import ingest, oauth2
+from ..versions import post_versions
+
+
+router = APIRouter(prefix="/ingest", tags=["Ingest"])
+
+
+@router.post("/{table}")
+async def bulk_ingest(
+    table: Literal["posts", "votes"],
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    current_user: int = Depends(oauth2.get_current_user),
+    content_type: str = Header("application/x-ndjson"),
+):
+    """Load posts owned by, or votes cast by, the current user from a streamed
+    NDJSON body, or CSV with a header row when sent as ``text/csv``.
+
+    Each chunk is copied and committed on its own; the response reports the
+    rows inserted, skipped by the database and rejected by validation.
+    """
+
+    def after_commit(rows):
+        if table == "votes":
+            for post_id in {post_id for post_id, _ in rows}:
+                post_versions.bump(post_id)
+        else:
+            post_versions.bump()
+        replicas.mark_write(response, current_user.id)
+
+    return await ingest.ingest(
+        db,
+        table,
+        request.stream(),
+        user_id=current_user.id,
+        format="csv" if content_type.startswith("text/csv") else "ndjson",
+        after_commit=after_commit,
+    )
@@ -0,0 +1,25 @@
+import os
+from fastapi import APIRouter, Depends
+from .. import database, oauth2
+from ..config import settings
+
+
+router = APIRouter(
+    prefix="/internal",
+    tags=["Internal"],
+    include_in_schema=False,
+    dependencies=[Depends(oauth2.verify_internal_token)],
+)
+
+
+@router.get("/pool")
+async def pool_metrics():
+    # Every worker owns its pools, so this reports on the worker that answers
+    return {
+        "pid": os.getpid(),
+        "database_async": settings.database_async,
+        "engines": {
+            "sync": database.pool_status(database.engine),
+            "async": database.pool_status(database.async_engine.sync_engine),
+        },
+    }
@@ -0,0 +1,111 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+from .. import database, oauth2
+from ..metrics import PrometheusWriter, http_metrics
+from .post import post_reads
+
+
+router = APIRouter(
+    tags=["Metrics"], dependencies=[Depends(oauth2.verify_internal_token)]
+)
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    writer = PrometheusWriter()
+
+    writer.sample(
+        "http_requests_in_flight",
+        "gauge",
+        "Requests currently being served by this worker.",
+        http_metrics.in_flight,
+    )
+    for (method, route), metrics in list(http_metrics.routes.items()):
+        labels = {"method": method, "route": route}
+        writer.histogram(
+            "http_request_duration_seconds",
+            "Request latency by route.",
+            metrics.latency,
+            labels,
+        )
+        for status_code, count in list(metrics.statuses.items()):
+            writer.sample(
+                "http_requests_total",
+                "counter",
+                "Requests by route and status code.",
+                count,
+                {**labels, "status": status_code},
+            )
+        writer.sample(
+            "http_request_db_queries_total",
+            "counter",
+            "SQL statements executed while serving the route.",
+            metrics.queries,
+            labels,
+        )
+        writer.histogram(
+            "http_request_db_duration_seconds",
+            "Time per request spent executing SQL, by route.",
+            metrics.db_latency,
+            labels,
+        )
+
+    for name, engine in (
+        ("sync", database.engine),
+        ("async", database.async_engine.sync_engine),
+    ):
+        labels = {"engine": name}
+        status = database.pool_status(engine)
+        for key, help in (
+            ("checked_out", "Connections currently checked out of the pool."),
+            ("idle", "Connections idle in the pool."),
+            ("overflow", "Open connections beyond the pool size."),
+        ):
+            writer.sample(
+                f"db_pool_{key}_connections", "gauge", help, status[key], labels
+            )
+        writer.sample(
+            "db_pool_overflow_events_total",
+            "counter",
+            "Connections opened beyond the pool size.",
+            status["overflow_events"],
+            labels,
+        )
+        writer.sample(
+            "db_pool_checkout_timeouts_total",
+            "counter",
+            "Checkouts that gave up waiting for a connection.",
+            status["checkout_timeouts"],
+            labels,
+        )
+        writer.histogram(
+            "db_pool_checkout_wait_seconds",
+            "Time spent waiting for a pooled connection.",
+            engine.pool.metrics.checkout_wait,
+            labels,
+        )
+
+    for name, cache in (("token", oauth2.token_cache), ("user", oauth2.user_cache)):
+        labels = {"cache": name}
+        writer.sample(
+            "auth_cache_hits_total", "counter", "Auth cache hits.", cache.hits, labels
+        )
+        writer.sample(
+            "auth_cache_misses_total",
+            "counter",
+            "Auth cache misses.",
+            cache.misses,
+            labels,
+        )
+
+    for outcome, count in post_reads.stats().items():
+        writer.sample(
+            "post_reads_total",
+            "counter",
+            "Coalesced post reads: executed queries, reads that joined one in "
+            "flight and reads served from the micro-TTL cache.",
+            count,
+            {"outcome": outcome},
+        )
+
+    return writer.render()
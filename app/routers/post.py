@@ -1,33 +1,219 @@
-from typing import Optional
-from fastapi import status, Response, HTTPException, Depends, APIRouter
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from ..database import get_db
+import json
+from typing import Literal, Optional
+from fastapi import status, Response, HTTPException, Depends, APIRouter, Header, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, load_only, selectinload
+from sqlalchemy import delete, func, insert, or_, select, text, tuple_, update
+from sqlalchemy.dialects import postgresql
+from ..cache import SingleFlight, TTLCache
+from ..config import settings
+from ..database import get_db, get_db_factory, replicas, served_by_replica
 from .. import models, schemas, oauth2
+from ..pagination import InvalidCursor, decode_cursor, encode_cursor
+from ..responses import (
+    POST_FIELDS,
+    USER_FIELDS,
+    post_batch_response,
+    post_export_lines,
+    post_list_response,
+)
 from ..schemas import PostBase
+from ..versions import etag_matches, post_versions
 
 
 router = APIRouter(prefix="/posts", tags=["Posts"])
 
+# Rows per INSERT statement, keeps bind parameters well below the driver limit
+INSERT_CHUNK_SIZE = 1000
+
+# Per worker cache of (total, exact) for X-Total-Count, keyed by filter and the
+# list version so writes through this worker show up right away
+post_counts = TTLCache(
+    settings.posts_count_cache_size, settings.posts_count_cache_seconds
+)
+
+# Concurrent identical reads of a post, or of the first page of a listing,
+# share one query. Keys embed the ETag, so writes through this worker are
+# never served from it; other workers' writes show up within the micro-TTL.
+# They also name the source, so replica rows never reach primary readers
+post_reads = SingleFlight(
+    settings.read_coalesce_cache_size, settings.read_coalesce_ttl_seconds
+)
+
+
+def may_predate_etag(db: AsyncSession) -> bool:
+    """Whether rows read through ``db`` may predate a write this worker has
+    already counted in its ETags; such responses are sent without one."""
+    return served_by_replica(db) and replicas.may_lag()
+
+
+def read_source(db: AsyncSession) -> str:
+    return "replica" if served_by_replica(db) else "primary"
+
+
+async def count_posts(db: AsyncSession, where, key, exact: bool) -> tuple[int, bool]:
+    """Number of posts matching ``where`` and whether it is exact.
+
+    Unless ``exact`` is requested, large totals are the planner's estimate:
+    ``pg_class.reltuples`` for the whole table, the EXPLAIN row estimate for
+    a filter. Below ``posts_exact_count_threshold`` rows COUNT(*) is cheap
+    enough and used instead.
+    """
+    key = (key, post_versions.list_version)
+    cached = post_counts.get(key)
+    if cached is not None and (cached[1] or not exact):
+        return cached
+
+    if not exact:
+        if where is None:
+            estimate = await db.scalar(
+                text("SELECT reltuples FROM pg_class WHERE oid = 'posts'::regclass")
+            )
+        else:
+            query = select(models.Post.id).where(where).compile(
+                dialect=postgresql.dialect(paramstyle="named")
+            )
+            plan = await db.scalar(
+                text(f"EXPLAIN (FORMAT JSON) {query}"), query.params
+            )
+            if isinstance(plan, str):  # asyncpg does not decode untyped json
+                plan = json.loads(plan)
+            estimate = plan[0]["Plan"]["Plan Rows"]
+        # reltuples is -1 until the table is first analyzed, which is small
+        if estimate >= settings.posts_exact_count_threshold:
+            total = (int(estimate), False)
+            post_counts.set(key, total)
+            return total
+
+    query = select(func.count()).select_from(models.Post)
+    if where is not None:
+        query = query.where(where)
+    total = (await db.scalar(query), True)
+    post_counts.set(key, total)
+    return total
+
+
+def parse_fields(fields: Optional[str]) -> Optional[tuple[str, ...]]:
+    """Sparse fieldset of schemas.Post from e.g. ``fields=id,title,owner``."""
+    if fields is None:
+        return None
+    names = tuple(dict.fromkeys(name.strip() for name in fields.split(",")))
+    unknown = [name for name in names if name not in schemas.Post.model_fields]
+    if unknown or not names:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}",
+        )
+    return names
+
+
+def post_load_options(fields: Optional[tuple[str, ...]]) -> list:
+    if fields is None:
+        # owners are serialized with every post; one IN query loads each
+        # distinct owner once, where a join would repeat them on every row
+        return [selectinload(models.Post.owner)]
+    # id and created_at feed the pagination cursor, owner_id loads the owner
+    columns = {"id", "created_at", *(name for name in fields if name in POST_FIELDS)}
+    if "owner" in fields:
+        columns.add("owner_id")
+    options = [load_only(*(getattr(models.Post, name) for name in columns))]
+    if "owner" in fields:
+        options.append(selectinload(models.Post.owner))
+    return options
+
 
 @router.get("/", response_model=list[schemas.PostOut])
-def get_posts(
-    db: Session = Depends(get_db),
+async def get_posts(
+    response: Response,
+    db: AsyncSession = Depends(oauth2.get_read_db),
     current_user: int = Depends(oauth2.get_current_user),
     limit: int = 20,
     skip: int = 0,
     search: Optional[str] = "",
+    cursor: Optional[str] = None,
+    search_mode: Literal["substring", "fulltext"] = "substring",
+    exact: bool = Query(
+        False, description="Always compute X-Total-Count with COUNT(*)"
+    ),
+    fields: Optional[str] = Query(
+        None,
+        description="Comma separated Post fields to return, e.g. `id,title`; "
+        "unselected columns are not read from the database",
+    ),
+    if_none_match: Optional[str] = Header(None),
 ):
+    fields = parse_fields(fields)
+    etag = post_versions.list_etag(limit, skip, search, cursor, search_mode, fields)
+    if etag_matches(if_none_match, etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+        )
 
-    results = (
-        db.query(models.Post, func.count(models.Vote.post_id).label("votes"))
-        .join(models.Vote, models.Vote.post_id == models.Post.id, isouter=True)
-        .group_by(models.Post.id)
-        .filter(models.Post.title.contains(search))
-        .limit(limit)
-        .offset(skip)
-        .all()
+    query = select(models.Post, models.Post.vote_count.label("votes")).options(
+        *post_load_options(fields)
     )
+    ranked = search_mode == "fulltext" and bool(search)
+    if ranked:
+        if cursor:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="cursor is not supported with search_mode=fulltext",
+            )
+        # Match title/content through the GIN indexed tsvector, falling back
+        # to trigram indexed substring matches on the title, best matches first
+        ts_query = func.websearch_to_tsquery("english", search)
+        where = or_(
+            models.Post.search_vector.op("@@")(ts_query),
+            models.Post.title.contains(search),
+        )
+        query = query.filter(where).order_by(
+            func.ts_rank_cd(models.Post.search_vector, ts_query).desc(),
+            models.Post.id,
+        )
+    else:
+        # LIKE '%search%', served by the ix_posts_title_trgm trigram index
+        where = models.Post.title.contains(search) if search else None
+        if where is not None:
+            query = query.filter(where)
+        query = query.order_by(models.Post.created_at, models.Post.id)
+    # Keyset pagination: seek past the last row of the previous page through
+    # ix_posts_created_at_id instead of scanning and discarding `skip` rows
+    if cursor:
+        try:
+            created_at, id = decode_cursor(cursor)
+        except InvalidCursor:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor",
+            )
+        query = query.filter(
+            tuple_(models.Post.created_at, models.Post.id) > (created_at, id)
+        )
+
+    async def load_page():
+        results = (await db.execute(query.limit(limit).offset(skip))).all()
+        return results, await count_posts(db, where, (search, ranked), exact)
+
+    # the first page is what everyone hits at once, deeper pages rarely collide
+    if cursor is None and skip == 0:
+        results, (total, total_exact) = await post_reads.do(
+            ("list", etag, exact, read_source(db)), load_page
+        )
+    else:
+        results, (total, total_exact) = await load_page()
+    headers = {"X-Total-Count": str(total)}
+    if not may_predate_etag(db):
+        headers["ETag"] = etag
+    if not total_exact:
+        headers["X-Total-Count-Estimated"] = "true"
+    if not ranked and results and len(results) == limit:
+        last = results[-1].Post
+        headers["X-Next-Cursor"] = encode_cursor(last.created_at, last.id)
+    # sparse posts do not satisfy response_model, they always take the fast path
+    if settings.fast_json_responses or fields is not None:
+        return post_list_response(results, headers=headers, fields=fields)
+    response.headers.update(headers)
     """TypeError('cannot convert dictionary update sequence element #0 to a sequence')
 try to add this line of code before returning results:
 results = list ( map (lambda x : x._mapping, results) )
@@ -42,113 +228,288 @@ Please feel free to correct me if I'm wrong, or if you have any better workaroun
 
 
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=schemas.Post)
-def create_post(
+async def create_post(
     post: schemas.PostCreate,
-    db: Session = Depends(get_db),
+    response: Response,
+    db: AsyncSession = Depends(get_db),
     current_user: int = Depends(oauth2.get_current_user),
 ):
 
     new_post = models.Post(owner_id=current_user.id, **post.model_dump())
+    # loaded up front rather than refreshed after the commit, created_at comes
+    # back with the INSERT ... RETURNING
+    new_post.owner = await db.get(models.User, current_user.id)
 
     db.add(new_post)
-    db.commit()
-    db.refresh(new_post)
+    await db.commit()
+    post_versions.bump()
+    replicas.mark_write(response, current_user.id)
 
     return new_post
 
 
 @router.post("/multiple", response_model=list[schemas.Post])
-def create_multiple_posts(
+async def create_multiple_posts(
     posts: list[schemas.PostCreate],
-    db: Session = Depends(get_db),
+    response: Response,
+    db: AsyncSession = Depends(get_db),
     current_user: int = Depends(oauth2.get_current_user),
 ):
+    if len(posts) > settings.posts_max_batch_size:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {settings.posts_max_batch_size} posts can be created at once",
+        )
+
     new_posts = []
-    for post in posts:
-        # print(str(post))
-        # print(repr(post))
-        new_post = models.Post(owner_id=current_user.id, **post.model_dump())
-        db.add(new_post)
-        new_posts.append(new_post)
-    db.commit()  # Commit all new posts at once after adding them
-
-    # Optionally refresh each new post to load any database-generated values
-    for post in new_posts:
-        db.refresh(post)
+    # One multi-row INSERT ... RETURNING per chunk, joined to the owner in the
+    # same statement, instead of an INSERT plus a SELECT per post
+    for start in range(0, len(posts), INSERT_CHUNK_SIZE):
+        chunk = posts[start : start + INSERT_CHUNK_SIZE]
+        inserted = (
+            insert(models.Post)
+            .values(
+                [
+                    {"owner_id": current_user.id, **post.model_dump()}
+                    for post in chunk
+                ]
+            )
+            .returning(
+                models.Post.id,
+                models.Post.title,
+                models.Post.content,
+                models.Post.published,
+                models.Post.created_at,
+                models.Post.owner_id,
+            )
+            .cte("inserted")
+        )
+        results = await db.execute(
+            select(inserted, models.User)
+            .join(models.User, models.User.id == inserted.c.owner_id)
+            .order_by(inserted.c.id)
+        )
+        for row in results:
+            new_post = dict(row._mapping)
+            new_post["owner"] = new_post.pop("User")
+            new_posts.append(new_post)
+    await db.commit()  # Commit all new posts at once after adding them
+    post_versions.bump()
+    replicas.mark_write(response, current_user.id)
 
     return new_posts
 
 
-@router.get("/{post_id}", response_model=schemas.PostOut)
-def get_post(
-    post_id: int,
-    db: Session = Depends(get_db),
+async def stream_posts_ndjson(db_factory, chunk_size):
+    # Plain columns rather than ORM entities: nothing accumulates in the
+    # identity map, so memory is bounded by one partition of rows
+    query = (
+        select(
+            *(getattr(models.Post, name) for name in POST_FIELDS),
+            *(getattr(models.User, name) for name in USER_FIELDS),
+            models.Post.vote_count,
+        )
+        .join(models.User, models.User.id == models.Post.owner_id)
+        .order_by(models.Post.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    async with db_factory() as db:
+        result = await db.stream(query)
+        try:
+            async for rows in result.partitions():
+                yield post_export_lines(rows)
+        finally:
+            await result.close()
+
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_posts(
+    db_factory=Depends(get_db_factory),
     current_user: int = Depends(oauth2.get_current_user),
 ):
+    """Every post, with its owner and votes, as newline delimited JSON.
 
-    post = (
-        db.query(models.Post, func.count(models.Vote.post_id).label("votes"))
-        .join(models.Vote, models.Vote.post_id == models.Post.id, isouter=True)
-        .group_by(models.Post.id)
-        .filter(models.Post.id == post_id)
-        .first()
+    Rows are read through a server-side cursor and sent as they arrive, one
+    ``PostOut`` object per line.
+    """
+    return StreamingResponse(
+        stream_posts_ndjson(db_factory, settings.posts_export_chunk_size),
+        media_type="application/x-ndjson",
     )
-    if not post:
+
+
+@router.get("/batch", response_model=list[schemas.PostBatchItem])
+async def get_posts_batch(
+    # not required here: FastAPI 0.110 fails to render the error for a missing
+    # list query parameter and answers 500, see the explicit check below
+    ids: list[int] = Query([]),
+    fields: Optional[str] = Query(None, description="Sparse fieldset, as for GET /posts"),
+    db: AsyncSession = Depends(oauth2.get_read_db),
+    current_user: int = Depends(oauth2.get_current_user),
+):
+    """Fetch several posts at once, e.g. ``/posts/batch?ids=3&ids=1&ids=7``.
+
+    Entries come back in request order, with ``post`` set to null for ids that
+    do not exist, so a feed can render all of its cards from one request.
+    """
+    fields = parse_fields(fields)
+    if not ids:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Post with id : {post_id} does not exist.",
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="At least one id is required",
         )
-    return post
+    if len(ids) > settings.posts_max_batch_get:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.posts_max_batch_get} posts can be fetched at once",
+        )
+
+    results = (
+        await db.execute(
+            select(models.Post, models.Post.vote_count.label("votes"))
+            .filter(models.Post.id.in_(set(ids)))
+            .options(*post_load_options(fields))
+        )
+    ).all()
+    if settings.fast_json_responses or fields is not None:
+        return post_batch_response(ids, results, fields)
+    found = {row.Post.id: row._mapping for row in results}
+    return [{"id": id, "post": found.get(id)} for id in ids]
 
 
-@router.delete("/{post_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_post(
+@router.get("/{post_id}", response_model=schemas.PostOut)
+async def get_post(
     post_id: int,
-    db: Session = Depends(get_db),
+    response: Response,
+    db: AsyncSession = Depends(oauth2.get_read_db),
     current_user: int = Depends(oauth2.get_current_user),
+    if_none_match: Optional[str] = Header(None),
 ):
+    # Answer revalidations from the version index without touching the database
+    etag = post_versions.post_etag(post_id)
+    if etag_matches(if_none_match, etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+        )
+
+    async def load_post():
+        result = await db.execute(
+            select(models.Post, models.Post.vote_count.label("votes"))
+            .filter(models.Post.id == post_id)
+            # a single row, the owner comes with it in the same statement
+            .options(joinedload(models.Post.owner))
+        )
+        return result.first()
 
-    post = db.query(models.Post).filter(models.Post.id == post_id).first()
+    # the row is only read from here on, so it can be shared between requests
+    post = await post_reads.do(("post", etag, read_source(db)), load_post)
     if not post:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Post with id : {post_id} Not Found",
+            detail=f"Post with id : {post_id} does not exist.",
         )
-    if post.owner_id != current_user.id:
+    if not may_predate_etag(db):
+        response.headers["ETag"] = etag
+    return post
+
+
+async def raise_write_miss(db: AsyncSession, post_id: int):
+    """Explain why a write guarded by the owner check matched no row: only
+    this rare path looks the post up to tell 404 from 403."""
+    await db.rollback()
+    owner_id = await db.scalar(
+        select(models.Post.owner_id).filter(models.Post.id == post_id)
+    )
+    if owner_id is None:
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorised to perform requested action",
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Post with id : {post_id} Not Found",
         )
+    raise HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail="Not authorised to perform requested action",
+    )
+
+
+@router.delete("/{post_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_post(
+    post_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: int = Depends(oauth2.get_current_user),
+):
+
+    result = await db.execute(
+        delete(models.Post)
+        .where(models.Post.id == post_id, models.Post.owner_id == current_user.id)
+        .returning(models.Post.id)
+    )
+    if result.first() is None:
+        await raise_write_miss(db, post_id)
 
     # return {"message": f"Post with id : {post_id} deleted successfully"}
-    db.delete(post)
-    db.commit()
-    return Response(status_code=status.HTTP_204_NO_CONTENT)
+    await db.commit()
+    post_versions.bump(post_id)
+    response = Response(status_code=status.HTTP_204_NO_CONTENT)
+    replicas.mark_write(response, current_user.id)
+    return response
+
+
+async def apply_post_update(
+    db: AsyncSession, response: Response, post_id: int, values: dict, current_user
+):
+    # UPDATE ... RETURNING joined to the owner, one round trip for the write,
+    # the ownership check and the response
+    updated = (
+        update(models.Post)
+        .where(models.Post.id == post_id, models.Post.owner_id == current_user.id)
+        .values(**values)
+        .returning(*(getattr(models.Post, name) for name in POST_FIELDS))
+        .cte("updated")
+    )
+    row = (
+        await db.execute(
+            select(updated, models.User).join(
+                models.User, models.User.id == updated.c.owner_id
+            )
+        )
+    ).first()
+    if row is None:
+        await raise_write_miss(db, post_id)
+    await db.commit()
+    post_versions.bump(post_id)
+    replicas.mark_write(response, current_user.id)
+
+    post = dict(row._mapping)
+    post["owner"] = post.pop("User")
+    return post
 
 
 @router.put("/{post_id}", response_model=schemas.Post)
-def update_post(
+async def update_post(
     post_id: int,
     updated_post: schemas.PostCreate,
-    db: Session = Depends(get_db),
+    response: Response,
+    db: AsyncSession = Depends(get_db),
     current_user: int = Depends(oauth2.get_current_user),
 ):
+    return await apply_post_update(
+        db, response, post_id, updated_post.model_dump(), current_user
+    )
 
-    updated_post_query = db.query(models.Post).filter(models.Post.id == post_id)
-
-    post = updated_post_query.first()
 
-    if not post:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Post with id : {post_id} Not Found",
-        )
-
-    if post.owner_id != current_user.id:
+@router.patch("/{post_id}", response_model=schemas.Post)
+async def patch_post(
+    post_id: int,
+    changes: schemas.PostUpdate,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    current_user: int = Depends(oauth2.get_current_user),
+):
+    # only the fields present in the body, null counts as absent
+    values = changes.model_dump(exclude_unset=True, exclude_none=True)
+    if not values:
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorised to perform requested action",
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="No fields to update",
         )
-    updated_post_query.update(updated_post.model_dump())
-    db.commit()
-    return updated_post_query.first()
+    return await apply_post_update(db, response, post_id, values, current_user)
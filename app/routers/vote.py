@@ -1,48 +1,72 @@
-from fastapi import status, HTTPException, Depends, APIRouter
-from sqlalchemy.orm import Session
-from ..database import get_db
+from fastapi import status, HTTPException, Depends, APIRouter, Response
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_db, replicas
 from .. import models, schemas, utils, oauth2
+from ..versions import post_versions
 
 
 router = APIRouter(prefix="/vote", tags=["Vote"])
 
 
 @router.post("/", status_code=status.HTTP_201_CREATED)
-def vote(
+async def vote(
     vote: schemas.Vote,
-    db: Session = Depends(get_db),
+    response: Response,
+    db: AsyncSession = Depends(get_db),
     current_user: int = Depends(oauth2.get_current_user),
 ):
-    post = db.query(models.Post).filter(models.Post.id == vote.post_id).first()
-    if not post:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Post {vote.post_id} does not exist",
-        )
-
-    vote_query = db.query(models.Vote).filter(
-        models.Vote.post_id == vote.post_id, models.Vote.user_id == current_user.id
-    )
-    found_vote = vote_query.first()
-    print(f"This is found post:{found_vote}")
+    # A single statement per vote: the primary key on votes detects duplicates
+    # (even between racing requests) and the foreign key detects missing posts
     if vote.dir == 1:
-        if found_vote:
+        try:
+            result = await db.execute(
+                insert(models.Vote)
+                .values(post_id=vote.post_id, user_id=current_user.id)
+                .on_conflict_do_nothing()
+                .returning(models.Vote.post_id)
+            )
+        except IntegrityError:
+            await db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Post {vote.post_id} does not exist",
+            )
+        if result.first() is None:
+            await db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT,
                 detail=f"User {current_user.id} has already voted on post {vote.post_id}",
             )
-
-        new_vote = models.Vote(post_id=vote.post_id, user_id=current_user.id)
-        db.add(new_vote)
-        db.commit()
+        await db.commit()
+        post_versions.bump(vote.post_id)
+        replicas.mark_write(response, current_user.id)
         return {"message": "Successfully added vote"}
 
     else:
-        if not found_vote:
+        result = await db.execute(
+            delete(models.Vote)
+            .where(
+                models.Vote.post_id == vote.post_id,
+                models.Vote.user_id == current_user.id,
+            )
+            .returning(models.Vote.post_id)
+        )
+        if result.first() is None:
+            await db.rollback()
+            # Rare miss path, only here do we look up the post to pick the error
+            if not await db.get(models.Post, vote.post_id):
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"Post {vote.post_id} does not exist",
+                )
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Vote does not exist",
             )
-        db.delete(found_vote)
-        db.commit()
+        await db.commit()
+        post_versions.bump(vote.post_id)
+        replicas.mark_write(response, current_user.id)
         return {"message": "Successfully deleted vote"}
@@ -20,6 +20,12 @@ class PostCreate(PostBase):
     pass
 
 
+class PostUpdate(BaseModel):
+    title: Optional[str] = None
+    content: Optional[str] = None
+    published: Optional[bool] = None
+
+
 class UserCreate(BaseModel):
     email: EmailStr
     password: str
@@ -47,13 +53,33 @@ class PostOut(BaseModel):
     votes: int
 
 
+class PostBatchItem(BaseModel):
+    id: int
+    post: Optional[PostOut] = None
+
+
+class Principal(BaseModel):
+    """The authenticated user as described by the claims of their token."""
+
+    id: int
+    email: EmailStr
+
+
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 
 class TokenData(BaseModel):
     id: Optional[str] = None
+    exp: Optional[datetime] = None
+    email: Optional[str] = None
+    ver: Optional[int] = None
 
 
 class Vote(BaseModel):
@@ -1,7 +1,17 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from passlib.context import CryptContext
+from starlette.concurrency import run_in_threadpool
+from .config import settings
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt pins a core for each call; a process pool keeps login bursts from
+# starving the worker's event loop and threadpool. Each worker process starts
+# its own pool of settings.password_hash_workers processes
+_hash_executor = None
+
 
 def hash(password: str):
     return pwd_context.hash(password)
@@ -9,3 +19,36 @@ def hash(password: str):
 
 def verify(plain_password: str, hashed_password: str):
     return pwd_context.verify(plain_password, hashed_password)
+
+
+def _get_hash_executor():
+    global _hash_executor
+    if _hash_executor is None:
+        _hash_executor = ProcessPoolExecutor(
+            max_workers=settings.password_hash_workers,
+            # forking a process that runs an event loop and threads is unsafe
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _hash_executor
+
+
+async def _run_hashing(fn, *args):
+    if settings.password_hash_workers <= 0:
+        return await run_in_threadpool(fn, *args)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_hash_executor(), fn, *args)
+
+
+async def hash_async(password: str):
+    return await _run_hashing(hash, password)
+
+
+async def verify_async(plain_password: str, hashed_password: str):
+    return await _run_hashing(verify, plain_password, hashed_password)
+
+
+def shutdown_hash_executor():
+    global _hash_executor
+    if _hash_executor is not None:
+        _hash_executor.shutdown(wait=False, cancel_futures=True)
+        _hash_executor = None
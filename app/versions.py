@@ -0,0 +1,54 @@
+import hashlib
+import time
+import uuid
+from typing import Optional
+from .config import settings
+
+
+class VersionIndex:
+    """In-memory per worker versions of posts, used to derive strong ETags.
+
+    Every write through this worker bumps the version of the post it touched
+    and the version shared by all post listings. The worker cannot see writes
+    handled by other workers (or made outside the API), so ETags also embed a
+    random worker token and an epoch that rotates every ``max_age`` seconds:
+    a validator from another worker never matches, and staleness is bounded
+    by ``max_age`` (``0`` disables rotation, for single worker deployments).
+    """
+
+    def __init__(self, max_age: int):
+        self.max_age = max_age
+        self.worker = uuid.uuid4().hex[:8]
+        self.list_version = 0
+        self._versions: dict[int, int] = {}
+
+    def _epoch(self) -> str:
+        if self.max_age <= 0:
+            return self.worker
+        return f"{self.worker}{int(time.time() // self.max_age):x}"
+
+    def post_etag(self, post_id: int) -> str:
+        return f'"p{post_id}-{self._versions.get(post_id, 0)}-{self._epoch()}"'
+
+    def list_etag(self, *params) -> str:
+        key = hashlib.blake2b(repr(params).encode(), digest_size=8).hexdigest()
+        return f'"l{key}-{self.list_version}-{self._epoch()}"'
+
+    def bump(self, post_id: Optional[int] = None):
+        """Call after the write has been committed."""
+        if post_id is not None:
+            self._versions[post_id] = self._versions.get(post_id, 0) + 1
+        self.list_version += 1
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison function
+    candidates = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return etag in candidates
+
+
+post_versions = VersionIndex(settings.etag_max_age_seconds)
@@ -0,0 +1,52 @@
+"""Response compression benchmark.
+
+Gzips GET /posts pages of typical PostOut rows (as rendered by the orjson
+fast path) at every compression level and reports the CPU time per page
+against the bytes saved, to pick COMPRESSION_LEVEL. No database is needed:
+
+    python -m benchmarks.compression --page-sizes 20 100 --rounds 50
+"""
+
+import argparse
+import json
+import time
+import zlib
+
+from app.responses import post_list_response
+from benchmarks.serialization import make_rows
+
+
+def measure(body, level, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        compressed = compressor.compress(body) + compressor.flush()
+    elapsed = (time.perf_counter() - start) / rounds
+    return {
+        "level": level,
+        "bytes": len(compressed),
+        "ratio": len(body) / len(compressed),
+        "compress_ms": elapsed * 1000,
+        "mb_per_second": len(body) / elapsed / 1e6,
+    }
+
+
+def main(args):
+    results = []
+    for page_size in args.page_sizes:
+        body = post_list_response(make_rows(page_size)).body
+        results.append(
+            {
+                "page_size": page_size,
+                "identity_bytes": len(body),
+                "levels": [measure(body, level, args.rounds) for level in range(1, 10)],
+            }
+        )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--page-sizes", type=int, nargs="+", default=[20, 100])
+    parser.add_argument("--rounds", type=int, default=50)
+    main(parser.parse_args())
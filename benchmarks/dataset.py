@@ -0,0 +1,196 @@
+"""Synthetic dataset generator.
+
+Loads users, posts and votes at production scale with COPY. The same --seed
+always produces the same rows. Authorship and votes follow Zipf
+distributions: a few prolific authors and a few viral posts, then a long
+tail. Every user's password is "password", so generated accounts can log in
+(e.g. user1@example.com for benchmarks.loadtest or manual testing):
+
+    DATABASE_NAME=fastapi_bench python -m benchmarks.dataset \\
+        --users 100000 --posts 1000000 --votes 5000000 --truncate
+
+Rows are numbered after the current maximum ids, and the id sequences are
+moved past them. created_at spans --days from a fixed --start rather than
+from the current time, so reruns produce identical rows, cursors and ETags.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+
+from app import models, utils
+from app.database import AsyncSessionLocal
+from app.ingest import copy_rows
+
+WORDS = (
+    "the quick brown fox jumps over lazy dog fastapi postgres python async "
+    "query index cursor vote post user cache latency throughput replica "
+    "stream batch token session pool worker request response json"
+).split()
+
+
+def zipf_cum_weights(count, skew):
+    """Cumulative weights of ranks 1..count under a Zipf law, for
+    ``random.choices``, which then samples by bisection."""
+    return list(itertools.accumulate(1 / rank**skew for rank in range(1, count + 1)))
+
+
+def sentence(rng, low, high):
+    return " ".join(rng.choices(WORDS, k=rng.randint(low, high)))
+
+
+def generate_users(first_id, count, password):
+    for id in range(first_id, first_id + count):
+        yield (id, f"user{id}@example.com", password)
+
+
+def generate_posts(rng, first_id, count, user_ids, author_skew, start, span):
+    # popularity ranks are shuffled so prolific authors are not just low ids
+    authors = user_ids[:]
+    rng.shuffle(authors)
+    cum_weights = zipf_cum_weights(len(authors), author_skew)
+    owners = rng.choices(authors, cum_weights=cum_weights, k=count)
+    for offset, owner_id in enumerate(owners):
+        yield (
+            first_id + offset,
+            sentence(rng, 3, 10).capitalize(),
+            sentence(rng, 20, 120),
+            rng.random() > 0.05,
+            # ascending with id, like real inserts
+            start + span * offset / count,
+            owner_id,
+        )
+
+
+def generate_votes(rng, count, user_ids, post_ids, post_skew):
+    """Unique (post_id, user_id) pairs, voters uniform, posts Zipf skewed."""
+    posts = post_ids[:]
+    rng.shuffle(posts)
+    cum_weights = zipf_cum_weights(len(posts), post_skew)
+    per_user, extra = divmod(count, len(user_ids))
+    for index, user_id in enumerate(user_ids):
+        wanted = min(per_user + (index < extra), len(posts))
+        chosen = set()
+        while len(chosen) < wanted:
+            chosen.update(
+                rng.choices(posts, cum_weights=cum_weights, k=wanted - len(chosen))
+            )
+        for post_id in sorted(chosen):
+            yield (post_id, user_id)
+
+
+def parse_start(value):
+    start = datetime.fromisoformat(value)
+    return start if start.tzinfo else start.replace(tzinfo=timezone.utc)
+
+
+async def load(db, table, columns, rows, chunk_size):
+    loaded = 0
+    while chunk := list(itertools.islice(rows, chunk_size)):
+        await copy_rows(db, table, columns, chunk)
+        loaded += len(chunk)
+    return loaded
+
+
+async def next_id(db, table):
+    return await db.scalar(text(f"SELECT COALESCE(max(id), 0) + 1 FROM {table}"))
+
+
+async def main(args):
+    rng = random.Random(args.seed)
+    password = utils.hash("password")
+    results = {"seed": args.seed}
+    async with AsyncSessionLocal() as db:
+        if args.truncate:
+            await db.execute(
+                text("TRUNCATE votes, posts, users RESTART IDENTITY CASCADE")
+            )
+
+        start = time.perf_counter()
+        first_user = await next_id(db, models.User.__tablename__)
+        results["users"] = await load(
+            db,
+            models.User.__tablename__,
+            ("id", "email", "password"),
+            generate_users(first_user, args.users, password),
+            args.chunk_size,
+        )
+        user_ids = list(range(first_user, first_user + args.users))
+
+        first_post = await next_id(db, models.Post.__tablename__)
+        results["posts"] = await load(
+            db,
+            models.Post.__tablename__,
+            ("id", "title", "content", "published", "created_at", "owner_id"),
+            generate_posts(
+                rng,
+                first_post,
+                args.posts,
+                user_ids,
+                args.author_skew,
+                args.start,
+                timedelta(days=args.days),
+            ),
+            args.chunk_size,
+        )
+        post_ids = list(range(first_post, first_post + args.posts))
+
+        # the vote_count triggers fire once per COPY chunk
+        results["votes"] = await load(
+            db,
+            models.Vote.__tablename__,
+            ("post_id", "user_id"),
+            generate_votes(rng, args.votes, user_ids, post_ids, args.post_skew),
+            args.chunk_size,
+        )
+        for table in (models.User.__tablename__, models.Post.__tablename__):
+            await db.execute(
+                text(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                    f"(SELECT max(id) FROM {table}))"
+                )
+            )
+        await db.commit()
+        elapsed = time.perf_counter() - start
+        await db.execute(text("ANALYZE users, posts, votes"))
+
+        top = await db.scalars(
+            text("SELECT vote_count FROM posts ORDER BY vote_count DESC LIMIT 5")
+        )
+        results["top_post_votes"] = list(top)
+    total = results["users"] + results["posts"] + results["votes"]
+    results["seconds"] = elapsed
+    results["rows_per_second"] = total / elapsed
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--posts", type=int, default=100_000)
+    parser.add_argument("--votes", type=int, default=500_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--author-skew", type=float, default=1.0, help="Zipf exponent of posts per user"
+    )
+    parser.add_argument(
+        "--post-skew", type=float, default=1.1, help="Zipf exponent of votes per post"
+    )
+    parser.add_argument(
+        "--start",
+        type=parse_start,
+        default="2025-01-01T00:00:00+00:00",
+        help="earliest created_at, ISO 8601, UTC unless an offset is given",
+    )
+    parser.add_argument("--days", type=float, default=365, help="span of created_at")
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    parser.add_argument(
+        "--truncate", action="store_true", help="empty users, posts and votes first"
+    )
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,277 @@
+"""HTTP load test with latency regression checks.
+
+Boots ``app.main:app`` under uvicorn against the configured (migrated)
+database, unless --base-url points at a running server, then drives
+concurrent clients through a weighted mix of login, list, get, vote and
+create requests. Reports requests/second and p50/p95/p99 latencies per
+endpoint as JSON and, given a baseline from an earlier run, flags endpoints
+whose p95 or throughput regressed by more than --tolerance:
+
+    DATABASE_NAME=fastapi_bench python -m benchmarks.loadtest --output run.json
+    DATABASE_NAME=fastapi_bench python -m benchmarks.loadtest --baseline run.json
+
+Exits with status 1 when a regression is flagged.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+
+import httpx
+
+from benchmarks.login_storm import percentile
+
+DEFAULT_MIX = "list=50,get=25,vote=10,create=10,login=5"
+
+
+@contextlib.contextmanager
+def server(args):
+    if args.base_url:
+        yield args.base_url
+        return
+    command = [
+        sys.executable, "-m", "uvicorn", "app.main:app",
+        "--port", str(args.port), "--workers", str(args.workers),
+        "--no-access-log", "--log-level", "warning",
+    ]  # fmt: skip
+    process = subprocess.Popen(command, env=os.environ.copy())
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                httpx.get(f"{base_url}/openapi.json").raise_for_status()
+                break
+            except httpx.HTTPError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("uvicorn did not start")
+                time.sleep(0.2)
+        yield base_url
+    finally:
+        process.terminate()
+        process.wait()
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def request(self, name, client, method, url, expected=(200,), **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[name] += 1
+            return None
+        self.latencies[name].append((time.perf_counter() - start) * 1000)
+        if response.status_code not in expected:
+            self.errors[name] += 1
+        return response
+
+    def summary(self, elapsed):
+        endpoints = {}
+        for name in sorted(set(self.latencies) | set(self.errors)):
+            samples = self.latencies[name]
+            endpoints[name] = {
+                "count": len(samples),
+                "errors": self.errors[name],
+                "requests_per_second": len(samples) / elapsed,
+                "p50_ms": percentile(samples, 50),
+                "p95_ms": percentile(samples, 95),
+                "p99_ms": percentile(samples, 99),
+                "mean_ms": statistics.fmean(samples) if samples else None,
+            }
+        samples = [sample for values in self.latencies.values() for sample in values]
+        total = {
+            "count": len(samples),
+            "errors": sum(self.errors.values()),
+            "requests_per_second": len(samples) / elapsed,
+            "p50_ms": percentile(samples, 50),
+            "p95_ms": percentile(samples, 95),
+            "p99_ms": percentile(samples, 99),
+        }
+        return endpoints, total
+
+
+async def setup(new_client, users, posts_per_user):
+    """Register users, log them in and give each a few posts to read.
+
+    Every account gets its own client, and with it its own cookie jar, like
+    separate browsers: the read-your-writes cookie set by one user's writes
+    must not pin every other virtual user's reads to the primary.
+    """
+    accounts = []
+    for _ in range(users):
+        client = new_client()
+        credentials = {"username": f"load-{uuid.uuid4().hex}@example.com", "password": "load"}
+        response = await client.post(
+            "/users/",
+            json={"email": credentials["username"], "password": credentials["password"]},
+        )
+        response.raise_for_status()
+        response = await client.post("/login", data=credentials)
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        accounts.append((client, credentials, headers))
+
+    post_ids = []
+    for client, _, headers in accounts:
+        response = await client.post(
+            "/posts/multiple",
+            json=[
+                {"title": f"load title {i}", "content": "load test content " * 20}
+                for i in range(posts_per_user)
+            ],
+            headers=headers,
+        )
+        response.raise_for_status()
+        post_ids.extend(post["id"] for post in response.json())
+    return accounts, post_ids
+
+
+async def run_client(recorder, rng, mix, accounts, post_ids, deadline):
+    scenarios, weights = zip(*mix.items())
+    while time.monotonic() < deadline:
+        client, credentials, headers = rng.choice(accounts)
+        scenario = rng.choices(scenarios, weights)[0]
+        if scenario == "list":
+            await recorder.request(
+                "list", client, "GET", "/posts/", params={"limit": 20}, headers=headers
+            )
+        elif scenario == "get":
+            await recorder.request(
+                "get", client, "GET", f"/posts/{rng.choice(post_ids)}", headers=headers
+            )
+        elif scenario == "vote":
+            vote = {"post_id": rng.choice(post_ids), "dir": 1}
+            response = await recorder.request(
+                "vote", client, "POST", "/vote/", expected=(201, 409), json=vote, headers=headers
+            )
+            if response is not None and response.status_code == 409:
+                await recorder.request(
+                    "unvote", client, "POST", "/vote/", expected=(201,),
+                    json={**vote, "dir": 0}, headers=headers,
+                )  # fmt: skip
+        elif scenario == "create":
+            await recorder.request(
+                "create", client, "POST", "/posts/", expected=(201,),
+                json={"title": "load title", "content": "load test content " * 20},
+                headers=headers,
+            )  # fmt: skip
+        elif scenario == "login":
+            await recorder.request("login", client, "POST", "/login", data=credentials)
+
+
+def compare(results, baseline, tolerance):
+    """Endpoints whose p95 rose or throughput fell by more than tolerance."""
+    regressions = []
+    for name, current in results["endpoints"].items():
+        previous = baseline["endpoints"].get(name)
+        if not previous or not current["count"] or not previous["count"]:
+            continue
+        if current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: p95 {previous['p95_ms']:.1f} -> {current['p95_ms']:.1f} ms"
+            )
+        if current["requests_per_second"] < previous["requests_per_second"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: {previous['requests_per_second']:.0f} -> "
+                f"{current['requests_per_second']:.0f} requests/s"
+            )
+    return regressions
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        mix[name.strip()] = float(weight)
+    unknown = set(mix) - {"list", "get", "vote", "create", "login"}
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return mix
+
+
+async def main(args, base_url):
+    rng = random.Random(args.seed)
+    # one connection pool shared by the per-account clients
+    transport = httpx.AsyncHTTPTransport(
+        limits=httpx.Limits(max_connections=args.concurrency)
+    )
+
+    def new_client():
+        return httpx.AsyncClient(base_url=base_url, transport=transport, timeout=60)
+
+    async with transport:
+        accounts, post_ids = await setup(new_client, args.users, args.posts_per_user)
+        recorder = Recorder()
+        start = time.monotonic()
+        deadline = start + args.duration
+        await asyncio.gather(
+            *(
+                run_client(
+                    recorder,
+                    random.Random(rng.random()),
+                    args.mix,
+                    accounts,
+                    post_ids,
+                    deadline,
+                )
+                for _ in range(args.concurrency)
+            )
+        )
+        elapsed = time.monotonic() - start
+
+    endpoints, total = recorder.summary(elapsed)
+    return {
+        "config": {
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+            "workers": None if args.base_url else args.workers,
+            "mix": args.mix,
+            "seed": args.seed,
+        },
+        "endpoints": endpoints,
+        "total": total,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", help="load an already running server instead")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--posts-per-user", type=int, default=20)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    with server(args) as base_url:
+        results = asyncio.run(main(args, base_url))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,111 @@
+"""Login storm benchmark.
+
+Fires concurrent logins at a running server while probing an unrelated,
+cheap endpoint, then reports login throughput and the probe's latency
+percentiles before and during the storm. Compare runs with
+PASSWORD_HASH_WORKERS=0 (threadpool) against a process pool, e.g.:
+
+    PASSWORD_HASH_WORKERS=4 uvicorn app.main:app --port 8000
+    python -m benchmarks.login_storm --base-url http://127.0.0.1:8000
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+
+import httpx
+
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def summarize(samples):
+    return {
+        "count": len(samples),
+        "p50_ms": percentile(samples, 50),
+        "p99_ms": percentile(samples, 99),
+        "mean_ms": statistics.fmean(samples) if samples else None,
+    }
+
+
+async def probe(client, headers, stop, interval):
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.get("/posts/", params={"limit": 1}, headers=headers)
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def storm(client, credentials, logins, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def login():
+        async with semaphore:
+            response = await client.post("/login", data=credentials)
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    return time.perf_counter() - start
+
+
+async def main(args):
+    credentials = {"username": f"storm-{uuid.uuid4().hex}@example.com", "password": "storm"}
+    limits = httpx.Limits(max_connections=args.concurrency + 1)
+    async with httpx.AsyncClient(
+        base_url=args.base_url, limits=limits, timeout=60
+    ) as client:
+        response = await client.post(
+            "/users/",
+            json={"email": credentials["username"], "password": credentials["password"]},
+        )
+        response.raise_for_status()
+        response = await client.post("/login", data=credentials)
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        stop = asyncio.Event()
+        baseline = asyncio.create_task(probe(client, headers, stop, args.probe_interval))
+        await asyncio.sleep(args.baseline_seconds)
+        stop.set()
+        idle_latencies = await baseline
+
+        stop = asyncio.Event()
+        during = asyncio.create_task(probe(client, headers, stop, args.probe_interval))
+        elapsed = await storm(client, credentials, args.logins, args.concurrency)
+        stop.set()
+        storm_latencies = await during
+
+    print(
+        json.dumps(
+            {
+                "logins": args.logins,
+                "concurrency": args.concurrency,
+                "logins_per_second": args.logins / elapsed,
+                "probe_idle": summarize(idle_latencies),
+                "probe_during_storm": summarize(storm_latencies),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--probe-interval", type=float, default=0.01)
+    parser.add_argument("--baseline-seconds", type=float, default=3)
+    asyncio.run(main(parser.parse_args()))
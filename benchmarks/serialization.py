@@ -0,0 +1,112 @@
+"""Post list serialization microbenchmark.
+
+Measures the cost of turning 1,000 (Post, votes) rows into response bytes
+through FastAPI's response_model path, a precompiled pydantic TypeAdapter,
+and the orjson fast path used by GET /posts. No database is needed:
+
+    python -m benchmarks.serialization --posts 1000 --rounds 50
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from pydantic import TypeAdapter
+
+from app import models, schemas
+from app.responses import post_list_response
+
+Row = namedtuple("Row", ["Post", "votes"])
+
+
+def make_rows(count):
+    now = datetime.now(timezone.utc)
+    owners = [
+        models.User(id=i, email=f"user{i}@example.com", password="x", created_at=now)
+        for i in range(20)
+    ]
+    return [
+        Row(
+            models.Post(
+                id=i,
+                title=f"post title {i}",
+                content="lorem ipsum dolor sit amet " * 20,
+                published=True,
+                created_at=now,
+                owner_id=owners[i % 20].id,
+                owner=owners[i % 20],
+            ),
+            i % 50,
+        )
+        for i in range(count)
+    ]
+
+
+async def response_model_path(field, rows):
+    content = await serialize_response(
+        field=field, response_content=[row._asdict() for row in rows], is_coroutine=True
+    )
+    return JSONResponse(content).body
+
+
+def type_adapter_path(adapter, rows):
+    return adapter.dump_json(
+        [
+            schemas.PostOut.model_construct(
+                Post=schemas.Post.model_construct(
+                    id=row.Post.id,
+                    title=row.Post.title,
+                    content=row.Post.content,
+                    published=row.Post.published,
+                    created_at=row.Post.created_at,
+                    owner_id=row.Post.owner_id,
+                    owner=schemas.UserOut.model_construct(
+                        id=row.Post.owner.id,
+                        email=row.Post.owner.email,
+                        created_at=row.Post.owner.created_at,
+                    ),
+                ),
+                votes=row.votes,
+            )
+            for row in rows
+        ]
+    )
+
+
+def timed(fn, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+def main(args):
+    rows = make_rows(args.posts)
+    field = create_response_field(name="Response_get_posts", type_=list[schemas.PostOut])
+    adapter = TypeAdapter(list[schemas.PostOut])
+    loop = asyncio.new_event_loop()
+
+    results = {
+        "posts": args.posts,
+        "response_model_ms": timed(
+            lambda: loop.run_until_complete(response_model_path(field, rows)),
+            args.rounds,
+        ),
+        "type_adapter_ms": timed(lambda: type_adapter_path(adapter, rows), args.rounds),
+        "orjson_fast_path_ms": timed(lambda: post_list_response(rows).body, args.rounds),
+    }
+    loop.close()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=50)
+    main(parser.parse_args())
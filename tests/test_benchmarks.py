@@ -0,0 +1,25 @@
+import inspect
+
+import pytest
+
+from benchmarks import bulk_insert
+
+
+@pytest.mark.parametrize(
+    "implementation",
+    [bulk_insert.create_multiple_posts, bulk_insert.legacy_create_multiple_posts],
+)
+def test_bulk_insert_matches_endpoint_signature(implementation):
+    # no database needed, only the arguments the benchmark would pass
+    arguments = bulk_insert.call_arguments(
+        implementation, posts=[], db=object(), current_user=object()
+    )
+    inspect.signature(implementation).bind(**arguments)
+
+
+def test_bulk_insert_reports_missing_arguments():
+    async def endpoint(posts, db, request):
+        pass
+
+    with pytest.raises(TypeError, match="request"):
+        bulk_insert.call_arguments(endpoint, posts=[], db=None, current_user=None)
@@ -0,0 +1,98 @@
+import gzip
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from app import models
+from app.middleware import CompressionMiddleware, accepts_gzip
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, expected",
+    [
+        ("gzip", True),
+        ("br;q=1.0, gzip;q=0.8", True),
+        ("*", True),
+        ("", False),
+        ("identity", False),
+        ("gzip;q=0", False),
+        ("*;q=0.5, gzip;q=0", False),
+        ("gzip;q=oops", False),
+    ],
+)
+def test_accepts_gzip(accept_encoding, expected):
+    assert accepts_gzip(accept_encoding) is expected
+
+
+def test_get_posts_compressed(authorized_client, test_user, session):
+    session.add_all(
+        models.Post(title=f"title {i}", content="content " * 50, owner_id=test_user["id"])
+        for i in range(20)
+    )
+    session.commit()
+
+    response = authorized_client.get("/posts", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"].startswith("W/")
+    assert len(response.json()) == 20
+    assert int(response.headers["content-length"]) < len(response.content) / 5
+
+    # the weakened validator still revalidates
+    etag = response.headers["etag"]
+    response = authorized_client.get(
+        "/posts", headers={"Accept-Encoding": "gzip", "If-None-Match": etag}
+    )
+    assert response.status_code == 304
+
+    response = authorized_client.get("/posts", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert not response.headers["etag"].startswith("W/")
+
+
+@pytest.fixture
+def app_client():
+    app = FastAPI()
+
+    @app.get("/small")
+    def small():
+        return PlainTextResponse("x" * 10)
+
+    @app.get("/large")
+    def large():
+        return PlainTextResponse("x" * 2000)
+
+    @app.get("/excluded/large")
+    def excluded():
+        return PlainTextResponse("x" * 2000)
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse(
+            (f"line {i}\n" for i in range(100)), media_type="application/x-ndjson"
+        )
+
+    app.add_middleware(
+        CompressionMiddleware, minimum_size=100, level=1, exclude_paths=["/excluded"]
+    )
+    return TestClient(app, headers={"Accept-Encoding": "gzip"})
+
+
+def test_compression_thresholds(app_client):
+    assert "content-encoding" not in app_client.get("/small").headers
+    assert "content-encoding" not in app_client.get("/excluded/large").headers
+
+    response = app_client.get("/large")
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.text == "x" * 2000
+
+
+def test_compression_streams(app_client):
+    with app_client.stream("GET", "/stream") as response:
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        raw = b"".join(response.iter_raw())
+    assert gzip.decompress(raw).decode() == "".join(f"line {i}\n" for i in range(100))
@@ -0,0 +1,99 @@
+import asyncio
+
+import orjson
+
+from app import ingest, models
+
+
+def ndjson(*records):
+    return b"".join(orjson.dumps(record) + b"\n" for record in records)
+
+
+def test_ingest_posts_ndjson(authorized_client, test_user, session, monkeypatch):
+    monkeypatch.setattr(ingest.settings, "ingest_chunk_size", 2)
+    body = ndjson(
+        {"title": "first", "content": "tab\there, back\\slash"},
+        {"title": "second", "content": "multi\nline", "published": False},
+        {"title": "missing content"},
+    ) + b"{not json\n"
+    response = authorized_client.post(
+        "/ingest/posts", content=body, headers={"Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == 200
+    report = response.json()
+    assert (report["inserted"], report["skipped"], report["rejected"]) == (2, 0, 2)
+    assert [chunk["lines"] for chunk in report["chunks"]] == [[1, 2], [3, 4]]
+    assert [reject["line"] for reject in report["chunks"][1]["rejected"]] == [3, 4]
+
+    posts = session.query(models.Post).order_by(models.Post.id).all()
+    assert [post.content for post in posts] == ["tab\there, back\\slash", "multi\nline"]
+    assert [post.published for post in posts] == [True, False]
+    assert all(post.owner_id == test_user["id"] for post in posts)
+
+
+def test_ingest_posts_csv(authorized_client, session):
+    body = (
+        b"title,content,published\n"
+        b'csv post,"quoted, with ""quotes""\nand a newline",\n'
+        b"draft,content,false\n"
+    )
+    response = authorized_client.post(
+        "/ingest/posts", content=body, headers={"Content-Type": "text/csv"}
+    )
+    assert response.json()["inserted"] == 2
+    posts = session.query(models.Post).order_by(models.Post.id).all()
+    assert posts[0].content == 'quoted, with "quotes"\nand a newline'
+    assert [post.published for post in posts] == [True, False]
+
+
+def test_ingest_reports_copy_errors(authorized_client, session, monkeypatch):
+    monkeypatch.setattr(ingest.settings, "ingest_chunk_size", 1)
+    body = ndjson(
+        {"title": "kept", "content": "c"},
+        # valid for the schema, but text columns cannot hold NUL
+        {"title": "nul \u0000", "content": "c"},
+        {"title": "also kept", "content": "c"},
+    )
+    response = authorized_client.post("/ingest/posts", content=body)
+    assert response.status_code == 200
+    report = response.json()
+    assert (report["inserted"], report["skipped"], report["rejected"]) == (2, 1, 0)
+    assert "error" in report["chunks"][1]
+    titles = [post.title for post in session.query(models.Post).order_by(models.Post.id)]
+    assert titles == ["kept", "also kept"]
+
+
+def test_ingest_votes(authorized_client, test_posts, session):
+    post_id = test_posts[0].id
+    body = ndjson(
+        {"post_id": post_id, "dir": 1},
+        {"post_id": post_id, "dir": 1},
+        {"post_id": test_posts[1].id, "dir": 1},
+        {"post_id": 9999, "dir": 1},
+        {"post_id": post_id, "dir": 0},
+    )
+    response = authorized_client.post("/ingest/votes", content=body)
+    report = response.json()
+    assert (report["inserted"], report["skipped"], report["rejected"]) == (2, 2, 1)
+
+    session.expire_all()
+    assert session.get(models.Post, post_id).vote_count == 1
+
+
+def test_unauthorised_user_ingest(client):
+    response = client.post("/ingest/posts", content=ndjson({"title": "t", "content": "c"}))
+    assert response.status_code == 401
+
+
+def test_read_records_splits_blocks():
+    async def blocks():
+        for block in (b'{"title": "a", "con', b'tent": "b"}\n{"ti', b'tle": "c"}'):
+            yield block
+
+    async def collect():
+        return [record async for record in ingest.read_records(blocks())]
+
+    assert asyncio.run(collect()) == [
+        (1, {"title": "a", "content": "b"}),
+        (2, {"title": "c"}),
+    ]
@@ -0,0 +1,42 @@
+from sqlalchemy import create_engine, text
+from app.config import settings
+from app.database import InstrumentedQueuePool, pool_status
+from .conftest import SQLALCHEMY_DATABASE_URL
+
+
+def test_pool_metrics(client):
+    response = client.get("/internal/pool")
+    engines = response.json()["engines"]
+    assert response.status_code == 200
+    assert set(engines) == {"sync", "async"}
+    assert {"checked_out", "idle", "checkout_wait_seconds"} <= set(engines["sync"])
+
+
+def test_instrumented_pool_counts_overflow():
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        poolclass=InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=1,
+    )
+    first, second = engine.connect(), engine.connect()
+    second.execute(text("SELECT 1"))
+    status = pool_status(engine)
+    first.close()
+    second.close()
+    engine.dispose()
+
+    assert status["checked_out"] == 2
+    assert status["overflow"] == 1
+    assert status["overflow_events"] == 1
+    assert status["checkout_wait_seconds"]["count"] == 2
+
+
+def test_internal_token(client, monkeypatch):
+    monkeypatch.setattr(settings, "internal_token", "scrape")
+    for path in ("/internal/pool", "/metrics"):
+        assert client.get(path).status_code == 401
+        response = client.get(path, headers={"Authorization": "Bearer wrong"})
+        assert response.status_code == 401
+        response = client.get(path, headers={"Authorization": "Bearer scrape"})
+        assert response.status_code == 200
@@ -0,0 +1,23 @@
+from app.metrics import http_metrics
+
+
+def test_metrics_exposition(authorized_client, test_posts):
+    authorized_client.get(f"/posts/{test_posts[0].id}")
+    response = authorized_client.get("/metrics")
+    body = response.text
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE http_request_duration_seconds histogram" in body
+    assert 'route="/posts/{post_id}"' in body
+    assert "db_pool_checkout_wait_seconds_bucket" in body
+
+
+def test_queries_attributed_to_route(authorized_client, test_posts):
+    route = http_metrics.routes.get(("GET", "/posts/{post_id}"))
+    queries_before = route.queries if route else 0
+
+    authorized_client.get(f"/posts/{test_posts[0].id}")
+
+    route = http_metrics.routes[("GET", "/posts/{post_id}")]
+    assert route.queries > queries_before
+    assert route.statuses[200] >= 1
@@ -1,4 +1,17 @@
-from app import schemas
+import asyncio
+import json
+import os
+import tracemalloc
+from contextlib import asynccontextmanager
+
+from sqlalchemy import text
+
+from app import models, schemas
+from app.cache import SingleFlight
+from app.config import settings
+from app.database import get_db
+from app.main import app
+from app.routers.post import post_reads, stream_posts_ndjson
 import pytest
 
 
@@ -136,3 +149,408 @@ def test_update_post_non_exist(authorized_client, test_posts):
     data = {"title": "updated title", "content": "updated content"}
     response = authorized_client.put("/posts/444", json=data)
     assert response.status_code == 404
+
+
+def test_get_posts_cursor_pagination(authorized_client, test_posts):
+    response = authorized_client.get("/posts", params={"limit": 3})
+    first_page = [post["Post"]["id"] for post in response.json()]
+    cursor = response.headers["X-Next-Cursor"]
+
+    response = authorized_client.get("/posts", params={"limit": 3, "cursor": cursor})
+    second_page = [post["Post"]["id"] for post in response.json()]
+    assert response.status_code == 200
+    assert "X-Next-Cursor" not in response.headers
+    assert first_page + second_page == [post.id for post in test_posts]
+
+
+def test_get_posts_invalid_cursor(authorized_client, test_posts):
+    response = authorized_client.get("/posts", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+def test_get_posts_fulltext_search(authorized_client, test_posts):
+    response = authorized_client.get(
+        "/posts", params={"search": "3rd content", "search_mode": "fulltext"}
+    )
+    posts = [post["Post"]["id"] for post in response.json()]
+    assert response.status_code == 200
+    assert posts[0] == test_posts[2].id
+
+
+def test_get_posts_fulltext_search_substring_fallback(authorized_client, test_posts):
+    response = authorized_client.get(
+        "/posts", params={"search": "itl", "search_mode": "fulltext"}
+    )
+    assert response.status_code == 200
+    assert len(response.json()) == len(test_posts)
+
+
+def test_create_multiple_posts(authorized_client, test_user):
+    data = [
+        {"title": f"title {i}", "content": f"content {i}", "published": i % 2 == 0}
+        for i in range(5)
+    ]
+    response = authorized_client.post("/posts/multiple", json=data)
+    new_posts = [schemas.Post(**post) for post in response.json()]
+    assert response.status_code == 200
+    assert [post.title for post in new_posts] == [post["title"] for post in data]
+    assert [post.published for post in new_posts] == [post["published"] for post in data]
+    assert all(post.owner.id == test_user["id"] for post in new_posts)
+    assert len({post.id for post in new_posts}) == len(data)
+
+
+def test_create_multiple_posts_too_many(authorized_client, monkeypatch):
+    monkeypatch.setattr(settings, "posts_max_batch_size", 2)
+    data = [{"title": "title", "content": "content"}] * 3
+    response = authorized_client.post("/posts/multiple", json=data)
+    assert response.status_code == 413
+
+
+def test_get_all_posts_fast_path_matches_default(
+    authorized_client, test_posts, monkeypatch
+):
+    fast = authorized_client.get("/posts").json()
+    monkeypatch.setattr(settings, "fast_json_responses", False)
+    default = authorized_client.get("/posts").json()
+    assert fast == default
+
+
+def test_get_one_post_not_modified(authorized_client, test_posts):
+    response = authorized_client.get(f"/posts/{test_posts[3].id}")
+    etag = response.headers["ETag"]
+
+    response = authorized_client.get(
+        f"/posts/{test_posts[3].id}", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+    authorized_client.post("/vote", json={"post_id": test_posts[3].id, "dir": 1})
+    response = authorized_client.get(
+        f"/posts/{test_posts[3].id}", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.json()["votes"] == 1
+    assert response.headers["ETag"] != etag
+
+
+def test_get_all_posts_not_modified(authorized_client, test_posts):
+    etag = authorized_client.get("/posts").headers["ETag"]
+    response = authorized_client.get("/posts", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    authorized_client.put(
+        f"/posts/{test_posts[0].id}",
+        json={"title": "updated title", "content": "updated content"},
+    )
+    response = authorized_client.get("/posts", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize("fast_json_responses", [True, False])
+def test_get_posts_batch(
+    authorized_client, test_posts, monkeypatch, fast_json_responses
+):
+    monkeypatch.setattr(settings, "fast_json_responses", fast_json_responses)
+    ids = [test_posts[2].id, 9999, test_posts[0].id]
+    response = authorized_client.get("/posts/batch", params={"ids": ids})
+    assert response.status_code == 200
+
+    entries = [schemas.PostBatchItem(**entry) for entry in response.json()]
+    assert [entry.id for entry in entries] == ids
+    assert entries[0].post.Post.title == test_posts[2].title
+    assert entries[1].post is None
+    assert entries[2].post.Post.owner.id == test_posts[0].owner_id
+
+
+def test_get_posts_batch_too_many(authorized_client, monkeypatch):
+    monkeypatch.setattr(settings, "posts_max_batch_get", 2)
+    response = authorized_client.get("/posts/batch", params={"ids": [1, 2, 3]})
+    assert response.status_code == 400
+
+
+def test_get_posts_batch_without_ids(authorized_client):
+    response = authorized_client.get("/posts/batch")
+    assert response.status_code == 422
+
+
+def test_unauthorised_user_get_posts_batch(client, test_posts):
+    response = client.get("/posts/batch", params={"ids": [test_posts[0].id]})
+    assert response.status_code == 401
+
+
+def test_export_posts(authorized_client, test_posts, monkeypatch):
+    monkeypatch.setattr(settings, "posts_export_chunk_size", 3)
+    post_ids = sorted(post.id for post in test_posts)
+    owner_id = test_posts[0].owner_id
+    authorized_client.post("/vote", json={"post_id": test_posts[0].id, "dir": 1})
+    response = authorized_client.get("/posts/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+
+    exported = [schemas.PostOut(**json.loads(line)) for line in response.iter_lines()]
+    assert [post.Post.id for post in exported] == post_ids
+    assert exported[0].votes == 1
+    assert exported[0].Post.owner.id == owner_id
+
+    # same objects as the paginated listing
+    listed = authorized_client.get("/posts", params={"limit": 10}).json()
+    assert sorted(listed, key=lambda post: post["Post"]["id"]) == [
+        json.loads(line) for line in response.iter_lines()
+    ]
+
+
+@pytest.mark.skipif(
+    not os.environ.get("RUN_SLOW_TESTS"), reason="set RUN_SLOW_TESTS=1 to run"
+)
+def test_export_posts_memory_stays_flat(client, test_user, session):
+    rows = 1_000_000
+    session.execute(
+        text(
+            "INSERT INTO posts (title, content, owner_id) "
+            "SELECT 'title ' || i, repeat('content ', 20), :owner_id "
+            "FROM generate_series(1, :rows) AS i"
+        ),
+        {"owner_id": test_user["id"], "rows": rows},
+    )
+    session.commit()
+    db_factory = asynccontextmanager(app.dependency_overrides[get_db])
+
+    async def consume():
+        exported = growth = 0
+        chunks = stream_posts_ndjson(db_factory, chunk_size=1000)
+        async for chunk in chunks:
+            exported += chunk.count(b"\n")
+            if exported == 10_000:
+                # connection, statement cache and first partitions are warm
+                baseline, _ = tracemalloc.get_traced_memory()
+                tracemalloc.reset_peak()
+            elif exported > 10_000:
+                growth = max(growth, tracemalloc.get_traced_memory()[1] - baseline)
+        return exported, growth
+
+    tracemalloc.start()
+    try:
+        exported, growth = asyncio.run(consume())
+    finally:
+        tracemalloc.stop()
+
+    assert exported == rows
+    # the full export is well over 200 MB, a few partitions are a few MB
+    assert growth < 10 * 1024 * 1024
+
+
+@pytest.fixture
+def many_posts(test_posts, test_user, test_user2, session):
+    session.add_all(
+        models.Post(
+            title=f"title {i}",
+            content="content",
+            owner_id=(test_user, test_user2)[i % 2]["id"],
+        )
+        for i in range(30)
+    )
+    session.commit()
+    return [post.id for post in session.query(models.Post).order_by(models.Post.id)]
+
+
+def test_post_reads_statement_counts(authorized_client, many_posts, assert_statements):
+    authorized_client.get("/posts")  # the current user is cached from now on
+
+    # one statement for the page and one for all of its distinct owners
+    with assert_statements(2):
+        response = authorized_client.get("/posts", params={"limit": 20})
+    assert len(response.json()) == 20
+    with assert_statements(1):
+        authorized_client.get(f"/posts/{many_posts[0]}")
+    with assert_statements(2):
+        authorized_client.get("/posts/batch", params={"ids": many_posts[:10]})
+    with assert_statements(1):
+        authorized_client.get("/posts/export")
+
+
+def test_post_writes_statement_counts(authorized_client, test_posts, assert_statements):
+    authorized_client.get("/posts")
+    post_id = test_posts[0].id
+
+    with assert_statements(2):
+        authorized_client.post("/posts", json={"title": "t", "content": "c"})
+    with assert_statements(1):
+        authorized_client.put(
+            f"/posts/{post_id}", json={"title": "t", "content": "c"}
+        )
+    with assert_statements(1):
+        authorized_client.patch(f"/posts/{post_id}", json={"title": "t"})
+    with assert_statements(1):
+        authorized_client.post("/vote", json={"post_id": post_id, "dir": 1})
+    with assert_statements(1):
+        authorized_client.delete(f"/posts/{post_id}")
+    # misses look the post up to pick the status code
+    with assert_statements(2):
+        response = authorized_client.delete(f"/posts/{test_posts[3].id}")
+    assert response.status_code == 403
+
+
+def test_patch_post(authorized_client, test_posts):
+    post = test_posts[0]
+    response = authorized_client.patch(
+        f"/posts/{post.id}", json={"published": False, "title": None}
+    )
+    assert response.status_code == 200
+    patched = schemas.Post(**response.json())
+    assert (patched.title, patched.content) == (post.title, post.content)
+    assert patched.published is False
+    assert patched.owner.id == post.owner_id
+
+
+@pytest.mark.parametrize(
+    "post_index, body, status_code",
+    [
+        (3, {"title": "t"}, 403),
+        (None, {"title": "t"}, 404),
+        (0, {}, 422),
+        (0, {"published": "maybe"}, 422),
+    ],
+)
+def test_patch_post_rejected(authorized_client, test_posts, post_index, body, status_code):
+    post_id = 8000000 if post_index is None else test_posts[post_index].id
+    response = authorized_client.patch(f"/posts/{post_id}", json=body)
+    assert response.status_code == status_code
+
+
+def test_unauthorised_user_patch_post(client, test_posts):
+    response = client.patch(f"/posts/{test_posts[0].id}", json={"title": "t"})
+    assert response.status_code == 401
+
+
+def test_get_posts_sparse_fields(authorized_client, test_posts, assert_statements):
+    authorized_client.get("/posts")
+
+    with assert_statements(1) as statements:
+        response = authorized_client.get("/posts", params={"fields": "id,title"})
+    assert response.status_code == 200
+    assert "posts.content" not in statements[0]
+    assert [set(post["Post"]) for post in response.json()] == [{"id", "title"}] * 4
+    assert all("votes" in post for post in response.json())
+
+    with assert_statements(2):
+        response = authorized_client.get("/posts", params={"fields": "title,owner"})
+    assert response.json()[0]["Post"]["owner"]["id"] == test_posts[0].owner_id
+
+    full = authorized_client.get("/posts")
+    sparse = authorized_client.get("/posts", params={"fields": "id,title"})
+    assert full.headers["ETag"] != sparse.headers["ETag"]
+
+
+def test_get_posts_batch_sparse_fields(authorized_client, test_posts):
+    response = authorized_client.get(
+        "/posts/batch", params={"ids": [test_posts[0].id, 9999], "fields": "content"}
+    )
+    assert response.json() == [
+        {"id": test_posts[0].id, "post": {"Post": {"content": test_posts[0].content}, "votes": 0}},
+        {"id": 9999, "post": None},
+    ]
+
+
+def test_get_posts_unknown_fields(authorized_client, test_posts):
+    response = authorized_client.get("/posts", params={"fields": "title,password"})
+    assert response.status_code == 400
+    assert "password" in response.json()["detail"]
+
+
+def test_get_posts_total_count(authorized_client, test_posts):
+    response = authorized_client.get("/posts", params={"limit": 2})
+    assert response.headers["X-Total-Count"] == "4"
+    assert "X-Total-Count-Estimated" not in response.headers
+    response = authorized_client.get("/posts", params={"search": "1st"})
+    assert response.headers["X-Total-Count"] == "1"
+
+    # cached per filter, but writes through this worker are seen right away
+    authorized_client.post("/posts", json={"title": "5th title", "content": "c"})
+    response = authorized_client.get("/posts", params={"limit": 2})
+    assert response.headers["X-Total-Count"] == "5"
+
+
+def test_get_posts_total_count_estimated(
+    authorized_client, test_posts, session, monkeypatch
+):
+    session.execute(text("ANALYZE posts"))
+    session.commit()
+    monkeypatch.setattr(settings, "posts_exact_count_threshold", 1)
+
+    response = authorized_client.get("/posts")
+    assert response.headers["X-Total-Count"] == "4"  # from pg_class.reltuples
+    assert response.headers["X-Total-Count-Estimated"] == "true"
+
+    response = authorized_client.get("/posts", params={"search": "title"})
+    assert response.headers["X-Total-Count-Estimated"] == "true"
+    assert int(response.headers["X-Total-Count"]) >= 1  # EXPLAIN estimate
+
+    response = authorized_client.get("/posts", params={"search": "title", "exact": True})
+    assert response.headers["X-Total-Count"] == "4"
+    assert "X-Total-Count-Estimated" not in response.headers
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    flight = SingleFlight(maxsize=10, ttl=60)
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "row"
+
+    async def run():
+        results = await asyncio.gather(*(flight.do("key", load) for _ in range(5)))
+        return results + [await flight.do("key", load)]
+
+    assert asyncio.run(run()) == ["row"] * 6
+    assert len(calls) == 1
+    assert flight.stats() == {"executed": 1, "coalesced": 4, "cached": 1}
+
+
+def test_single_flight_shares_errors_and_survives_cancellation():
+    flight = SingleFlight(maxsize=10, ttl=0)
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def slow():
+        await asyncio.sleep(0.01)
+        return "row"
+
+    async def run():
+        errors = await asyncio.gather(
+            *(flight.do("error", fail) for _ in range(3)), return_exceptions=True
+        )
+        assert all(isinstance(error, ValueError) for error in errors)
+
+        # a waiter whose leader is cancelled runs the call itself
+        leader = asyncio.ensure_future(flight.do("cancel", slow))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(flight.do("cancel", slow))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await waiter
+
+    assert asyncio.run(run()) == "row"
+    assert flight.stats()["executed"] == 2 + 1
+
+
+def test_repeated_post_read_is_coalesced(
+    authorized_client, test_posts, assert_statements, monkeypatch
+):
+    monkeypatch.setattr(post_reads.results, "ttl", 60)
+    post_id = test_posts[0].id
+    authorized_client.get(f"/posts/{post_id}")
+
+    with assert_statements(0):
+        response = authorized_client.get(f"/posts/{post_id}")
+    assert response.json()["Post"]["id"] == post_id
+
+    # a write changes the ETag and with it the key
+    authorized_client.put(f"/posts/{post_id}", json={"title": "new", "content": "c"})
+    response = authorized_client.get(f"/posts/{post_id}")
+    assert response.json()["Post"]["title"] == "new"
+    assert 'post_reads_total{outcome="cached"} 1' in authorized_client.get("/metrics").text
@@ -1,4 +1,5 @@
-from app import schemas
+from app import models, schemas
+from app.oauth2 import token_cache, user_cache
 from jose import jwt
 from app.config import settings
 import pytest
@@ -47,3 +48,88 @@ def test_login_user(client, test_user):
 def test_incorrect_login(client, test_user, email, password, status_code):
     response = client.post("/login", data={"username": email, "password": password})
     assert response.status_code == status_code
+
+
+def test_current_user_is_cached(authorized_client, test_user):
+    authorized_client.get("/posts")
+    hits = user_cache.hits
+    authorized_client.get("/posts")
+    assert user_cache.hits == hits + 1
+    assert token_cache.hits >= 1
+
+
+def test_cached_user_invalidated_on_delete(authorized_client, test_user, session):
+    authorized_client.get("/posts")
+    user = session.get(models.User, test_user["id"])
+    session.delete(user)
+    session.commit()
+
+    response = authorized_client.get("/posts")
+    assert response.status_code == 401
+
+
+def login(client, user):
+    response = client.post(
+        "/login", data={"username": user["email"], "password": user["password"]}
+    )
+    assert response.status_code == 200
+    return schemas.Token(**response.json())
+
+
+def bearer(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_refresh_token(client, test_user):
+    tokens = login(client, test_user)
+    payload = jwt.decode(
+        tokens.access_token, settings.secret_key, algorithms=[settings.algorithm]
+    )
+    assert payload["email"] == test_user["email"]
+    assert payload["ver"] == 0
+
+    response = client.post("/refresh", json={"refresh_token": tokens.refresh_token})
+    assert response.status_code == 200
+    refreshed = schemas.Token(**response.json())
+    assert client.get("/posts", headers=bearer(refreshed.access_token)).status_code == 200
+
+    # the token types are not interchangeable
+    assert client.get("/posts", headers=bearer(tokens.refresh_token)).status_code == 401
+    response = client.post("/refresh", json={"refresh_token": tokens.access_token})
+    assert response.status_code == 401
+
+
+def test_logout_revokes_tokens(client, test_user):
+    tokens = login(client, test_user)
+    assert client.get("/posts", headers=bearer(tokens.access_token)).status_code == 200
+
+    response = client.post("/logout", headers=bearer(tokens.access_token))
+    assert response.status_code == 204
+    assert client.get("/posts", headers=bearer(tokens.access_token)).status_code == 401
+    response = client.post("/refresh", json={"refresh_token": tokens.refresh_token})
+    assert response.status_code == 401
+
+    tokens = login(client, test_user)
+    assert client.get("/posts", headers=bearer(tokens.access_token)).status_code == 200
+
+
+def test_claims_only_skips_user_lookup(client, test_user, session, monkeypatch):
+    monkeypatch.setattr(settings, "auth_claims_only", True)
+    tokens = login(client, test_user)
+    session.delete(session.get(models.User, test_user["id"]))
+    session.commit()
+
+    # trusted until the access token expires, but it cannot be refreshed
+    assert client.get("/posts", headers=bearer(tokens.access_token)).status_code == 200
+    response = client.post("/refresh", json={"refresh_token": tokens.refresh_token})
+    assert response.status_code == 401
+
+
+def test_claims_only_falls_back_for_tokens_without_claims(
+    authorized_client, test_user, monkeypatch
+):
+    monkeypatch.setattr(settings, "auth_claims_only", True)
+    authorized_client.get("/posts")
+    hits, misses = user_cache.hits, user_cache.misses
+    authorized_client.get("/posts")
+    assert (user_cache.hits, user_cache.misses) == (hits + 1, misses)
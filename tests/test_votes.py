@@ -1,5 +1,17 @@
+import asyncio
+
+import httpx
 import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
 from app import models
+from app.config import settings
+from app.database import SyncSessionAdapter, get_db
+from app.main import app
+from app.oauth2 import create_access_token
+from .conftest import async_engine, engine
 
 
 @pytest.fixture
@@ -43,3 +55,92 @@ def test_vote_on_post_not_exist(authorized_client, test_posts):
     data = {"post_id": 44, "dir": 1}
     response = authorized_client.post("/vote", json=data)
     assert response.status_code == 404
+
+
+def test_vote_count_follows_votes(authorized_client, test_posts):
+    post_id = test_posts[3].id
+    authorized_client.post("/vote", json={"post_id": post_id, "dir": 1})
+    response = authorized_client.get(f"/posts/{post_id}")
+    assert response.json()["votes"] == 1
+
+    authorized_client.post("/vote", json={"post_id": post_id, "dir": 0})
+    response = authorized_client.get(f"/posts/{post_id}")
+    assert response.json()["votes"] == 0
+
+
+def test_concurrent_votes(session, test_posts):
+    """Race every vote against its own duplicate: exactly one of each pair may
+    win, the other gets a clean 409, and the counters stay exact."""
+    users = [models.User(email=f"voter{i}@test.com", password="x") for i in range(40)]
+    posts = [
+        models.Post(title=f"race {i}", content="c", owner_id=test_posts[0].owner_id)
+        for i in range(25)
+    ]
+    session.add_all(users + posts)
+    session.commit()
+    tokens = {user.id: create_access_token({"user_id": user.id}) for user in users}
+    post_ids = [post.id for post in posts]
+
+    # One session per request (unlike the shared test session), with as many
+    # pooled connections as requests in flight so sync mode cannot starve
+    # the threadpool waiting on connection checkouts
+    in_flight = 20
+    pooled_engine = create_engine(engine.url, pool_size=in_flight, max_overflow=0)
+    pooled_async_engine = None
+
+    async def override_get_db():
+        if settings.database_async:
+            async with async_sessionmaker(
+                pooled_async_engine, expire_on_commit=False
+            )() as db:
+                yield db
+        else:
+            db = SyncSessionAdapter(sessionmaker(pooled_engine)())
+            try:
+                yield db
+            finally:
+                await db.close()
+
+    async def race():
+        nonlocal pooled_async_engine
+        pooled_async_engine = create_async_engine(
+            async_engine.url, pool_size=in_flight, max_overflow=0
+        )
+        semaphore = asyncio.Semaphore(in_flight)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+
+            async def cast(user_id, post_id):
+                async with semaphore:
+                    response = await client.post(
+                        "/vote/",
+                        json={"post_id": post_id, "dir": 1},
+                        headers={"Authorization": f"Bearer {tokens[user_id]}"},
+                    )
+                return post_id, response.status_code
+
+            attempts = [
+                cast(user_id, post_id)
+                for user_id in tokens
+                for post_id in post_ids
+                for _ in range(2)
+            ]
+            results = await asyncio.gather(*attempts)
+        await pooled_async_engine.dispose()
+        return results
+
+    app.dependency_overrides[get_db] = override_get_db
+    try:
+        results = asyncio.run(race())
+    finally:
+        app.dependency_overrides.clear()
+        pooled_engine.dispose()
+
+    statuses = [status_code for _, status_code in results]
+    assert len(results) == 2 * len(tokens) * len(post_ids)
+    assert statuses.count(201) == len(tokens) * len(post_ids)
+    assert statuses.count(409) == len(tokens) * len(post_ids)
+
+    session.expire_all()
+    for post_id in post_ids:
+        assert session.get(models.Post, post_id).vote_count == len(tokens)